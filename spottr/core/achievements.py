@@ -0,0 +1,125 @@
+"""Achievement progress driven by domain events.
+
+Views and services call ``emit`` when something an achievement could count
+happens (a workout completed, a post, a streak moving...). Each event maps
+to the requirement types it can affect, and each requirement type has a
+metric that measures many users in one grouped query. Only the
+UserAchievement rows for those types and users are touched, in bulk.
+``backfill`` runs every metric for every user in batches.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Achievement, Friendship, Post, Profile, UserAchievement, UserStats
+
+
+def _workouts(user_ids):
+    return dict(UserStats.objects.filter(user_id__in=user_ids).values_list('user_id', 'total_workouts'))
+
+
+def _streak(user_ids):
+    return dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'longest_streak'))
+
+
+def _friends(user_ids):
+    counts = defaultdict(int)
+    for side in ('from_user_id', 'to_user_id'):
+        rows = Friendship.objects.filter(accepted=True, **{f'{side}__in': user_ids}).values(side).annotate(
+            n=Count('id')).values_list(side, 'n').order_by()
+        for user_id, n in rows:
+            counts[user_id] += n
+    return counts
+
+
+def _post_counter(**filters):
+    def metric(user_ids):
+        return dict(Post.objects.filter(user_id__in=user_ids, **filters).values('user_id').annotate(
+            n=Count('id')).values_list('user_id', 'n').order_by())
+    return metric
+
+
+# Achievement.requirement_type -> metric(user_ids) -> {user_id: value}
+METRICS = {
+    'workouts': _workouts,
+    'streak': _streak,
+    'friends': _friends,
+    'posts': _post_counter(),
+    'checkins': _post_counter(post_type='checkin'),
+    'prs': _post_counter(post_type='pr'),
+}
+
+# Event -> requirement types it can move
+EVENTS = {
+    'workout': ['workouts'],
+    'streak': ['streak'],
+    'friend': ['friends'],
+    'post': ['posts'],
+    'checkin': ['checkins', 'posts'],
+    'pr': ['prs', 'posts'],
+}
+
+
+def _evaluate(user_ids, achievements):
+    """Bring the users' rows for ``achievements`` up to date. Returns the newly unlocked rows."""
+    by_type = defaultdict(list)
+    for achievement in achievements:
+        by_type[achievement.requirement_type].append(achievement)
+    values = {t: METRICS[t](user_ids) for t in by_type if t in METRICS}
+    if not values:
+        return []
+
+    existing = {
+        (row.user_id, row.achievement_id): row
+        for row in UserAchievement.objects.filter(
+            user_id__in=user_ids, achievement__in=[a for t in values for a in by_type[t]]
+        )
+    }
+    now = timezone.now()
+    new, changed, unlocked = [], [], []
+    for requirement_type, metric in values.items():
+        for achievement in by_type[requirement_type]:
+            goal = achievement.requirement_value
+            for user_id in user_ids:
+                progress = min(metric.get(user_id, 0), goal)
+                row = existing.get((user_id, achievement.id))
+                if row is None:
+                    if not progress:
+                        continue
+                    row = UserAchievement(user_id=user_id, achievement=achievement)
+                    new.append(row)
+                elif row.progress == progress or row.unlocked:
+                    continue  # an unlocked achievement stays unlocked
+                else:
+                    changed.append(row)
+                row.progress = progress
+                if progress >= goal:
+                    row.achievement = achievement  # callers announce it by name
+                    row.unlocked = True
+                    row.unlocked_at = now
+                    unlocked.append(row)
+    with transaction.atomic():
+        UserAchievement.objects.bulk_create(new, batch_size=1000, ignore_conflicts=True)
+        UserAchievement.objects.bulk_update(changed, ['progress', 'unlocked', 'unlocked_at'], batch_size=1000)
+    return unlocked
+
+
+def emit(event, *user_ids):
+    """Record that ``event`` happened to the users. Returns the UserAchievements it unlocked."""
+    achievements = list(Achievement.objects.filter(requirement_type__in=EVENTS[event]))
+    if not achievements or not user_ids:
+        return []
+    return _evaluate(list(user_ids), achievements)
+
+
+def backfill(batch_size=1000):
+    """Evaluate every achievement for every user. Returns how many were unlocked."""
+    achievements = list(Achievement.objects.all())
+    unlocked = 0
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        unlocked += len(_evaluate(user_ids[start:start + batch_size], achievements))
+    return unlocked
@@ -0,0 +1,151 @@
+"""Day-level activity calendars built from workouts and posts.
+
+``days`` answers any date range with one grouped UNION query over Workout
+and Post, bucketing by the user's local day (the same day streaks use).
+``week`` and ``month`` cache their ranges per user; the cache keys carry a
+per-user generation that ``invalidate`` bumps whenever the user logs a
+workout or a post, so stale calendars are never read back.
+
+For multi-year heatmaps each user also has one ActivityYear row per year:
+a 46-byte bitmap with a bit per active day. ``record`` sets today's bit as
+activity is logged, so a year grid is a single row read.
+"""
+import calendar
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, Value
+from django.db.models.functions import TruncDate
+
+from .models import ActivityYear, Post, Workout
+
+CACHE_TIMEOUT = 60 * 60 * 24
+BITMAP_BYTES = 46  # 366 bits
+
+Day = namedtuple('Day', ['workouts', 'posts'])
+EMPTY = Day(0, 0)
+
+
+def _range(field, start, end, tz):
+    """Filter for ``field`` falling on local days ``start`` to ``end`` in ``tz``; None leaves a side open."""
+    bounds = {}
+    if start is not None:
+        bounds[f'{field}__gte'] = datetime.combine(start, datetime.min.time(), tz)
+    if end is not None:
+        bounds[f'{field}__lt'] = datetime.combine(end + timedelta(days=1), datetime.min.time(), tz)
+    return bounds
+
+
+def days(user_id, start, end, tz):
+    """``{date: Day(workouts, posts)}`` for active days from ``start`` to ``end`` inclusive, in ``tz``."""
+    workouts = Workout.objects.filter(
+        user_id=user_id, completed=True, **_range('started_at', start, end, tz),
+    ).annotate(day=TruncDate('started_at', tzinfo=tz), kind=Value(0, output_field=IntegerField())).values(
+        'day', 'kind').annotate(n=Count('id')).order_by()
+    posts = Post.objects.filter(
+        user_id=user_id, **_range('created_at', start, end, tz),
+    ).annotate(day=TruncDate('created_at', tzinfo=tz), kind=Value(1, output_field=IntegerField())).values(
+        'day', 'kind').annotate(n=Count('id')).order_by()
+
+    counts = {}
+    for row in workouts.union(posts, all=True):
+        workout_n, post_n = counts.get(row['day'], EMPTY)
+        if row['kind'] == 0:
+            workout_n += row['n']
+        else:
+            post_n += row['n']
+        counts[row['day']] = Day(workout_n, post_n)
+    return counts
+
+
+def _generation(user_id):
+    # Seeded from the clock so an evicted generation never reuses old keys
+    return cache.get_or_set(f'activity:{user_id}:gen', time.time_ns, None)
+
+
+def _cached(user_id, label, start, end, tz):
+    key = f'activity:{user_id}:{_generation(user_id)}:{tz.key}:{label}'
+    result = cache.get(key)
+    if result is None:
+        result = days(user_id, start, end, tz)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def week(user_id, week_start, tz):
+    """Activity for the seven days from ``week_start``, cached."""
+    return _cached(user_id, f'w{week_start.isoformat()}', week_start, week_start + timedelta(days=6), tz)
+
+
+def month(user_id, year, month_number, tz):
+    """Activity for a calendar month, cached."""
+    last = calendar.monthrange(year, month_number)[1]
+    return _cached(
+        user_id, f'm{year}-{month_number}', date(year, month_number, 1), date(year, month_number, last), tz,
+    )
+
+
+def invalidate(user_id):
+    key = f'activity:{user_id}:gen'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _day_index(day):
+    return day.timetuple().tm_yday - 1
+
+
+def _set_bit(bits, day):
+    index = _day_index(day)
+    bits[index // 8] |= 1 << (index % 8)
+
+
+def year_bitmap(user_id, year):
+    row = ActivityYear.objects.filter(user_id=user_id, year=year).values_list('bits', flat=True).first()
+    return bytes(row) if row is not None else bytes(BITMAP_BYTES)
+
+
+def active_days(bits, year):
+    """One bool per day of ``year``, January 1st first."""
+    length = 366 if calendar.isleap(year) else 365
+    return [bool(bits[i // 8] >> (i % 8) & 1) for i in range(length)]
+
+
+@transaction.atomic
+def mark(user_id, day):
+    # Make sure the row exists first: a racing get_or_create would hit the unique constraint
+    ActivityYear.objects.bulk_create(
+        [ActivityYear(user_id=user_id, year=day.year, bits=bytes(BITMAP_BYTES))], ignore_conflicts=True,
+    )
+    row = ActivityYear.objects.select_for_update().get(user_id=user_id, year=day.year)
+    bits = bytearray(row.bits)
+    before = bytes(bits)
+    _set_bit(bits, day)
+    if bits != before:
+        row.bits = bytes(bits)
+        row.save(update_fields=['bits'])
+
+
+def record(user_id, day):
+    """The user logged a workout or post on ``day``."""
+    mark(user_id, day)
+    invalidate(user_id)
+
+
+def rebuild(user_id, tz):
+    """Rewrite every ActivityYear row of the user from the workout and post tables, by local day in ``tz``."""
+    years = {}
+    for day in days(user_id, None, None, tz):
+        _set_bit(years.setdefault(day.year, bytearray(BITMAP_BYTES)), day)
+    with transaction.atomic():
+        ActivityYear.objects.filter(user_id=user_id).exclude(year__in=years).delete()
+        ActivityYear.objects.bulk_create(
+            [ActivityYear(user_id=user_id, year=year, bits=bytes(bits)) for year, bits in years.items()],
+            update_conflicts=True, unique_fields=['user', 'year'], update_fields=['bits'],
+        )
+    invalidate(user_id)
@@ -5,6 +5,8 @@ from .models import (
     WorkoutTemplate, TemplateExercise, Workout, WorkoutExercise,
     WorkoutSet, PersonalRecord, Group, GroupMembership, Message,
     WorkoutInvite, Nudge, Achievement, UserAchievement, GroupStreak,
+    TimelineEntry, UserStats, LeaderboardSnapshot, SyncChange, ChatReadState,
+    InviteResponse, CrowdReport, CrowdHourly, ActivityYear,
 )
 
 
@@ -14,6 +16,11 @@ class ProfileAdmin(admin.ModelAdmin):
     list_filter = ['status']
 
 
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_workouts', 'total_sets', 'total_weight']
+
+
 @admin.register(Gym)
 class GymAdmin(admin.ModelAdmin):
     list_display = ['name', 'address', 'busy_level', 'current_activity']
@@ -65,3 +72,11 @@ admin.site.register(WorkoutInvite)
 admin.site.register(Nudge)
 admin.site.register(UserAchievement)
 admin.site.register(GroupStreak)
+admin.site.register(TimelineEntry)
+admin.site.register(LeaderboardSnapshot)
+admin.site.register(SyncChange)
+admin.site.register(ChatReadState)
+admin.site.register(InviteResponse)
+admin.site.register(CrowdReport)
+admin.site.register(CrowdHourly)
+admin.site.register(ActivityYear)
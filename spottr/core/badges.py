@@ -0,0 +1,42 @@
+"""Cached per-user badge counts for the app chrome.
+
+The counts are computed together and cached under one key per user. The
+views that change them call ``invalidate`` for the affected users; the
+timeout only bounds staleness for edits made elsewhere (admin, shell).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import invites, unread
+from .models import Nudge, Profile
+
+NUDGE_WINDOW = timedelta(days=1)
+
+
+def _key(user_id):
+    return f'badges:{user_id}'
+
+
+def get(user_id):
+    data = cache.get(_key(user_id))
+    if data is None:
+        pending_invites = invites.pending_count(user_id)
+        unread_messages = unread.total(user_id)
+        data = {
+            'pending_invites': pending_invites,
+            'unread_messages': unread_messages,
+            'groups': pending_invites + unread_messages,
+            'nudges': Nudge.objects.filter(
+                to_user_id=user_id, created_at__gte=timezone.now() - NUDGE_WINDOW
+            ).count(),
+            'streak': Profile.objects.filter(user_id=user_id).values_list('current_streak', flat=True).first() or 0,
+        }
+        cache.set(_key(user_id), data, getattr(settings, 'SPOTTR_BADGES_CACHE_TIMEOUT', 300))
+    return data
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_key(uid) for uid in user_ids])
@@ -1,13 +1,17 @@
-from .models import WorkoutInvite
+from django.utils.functional import SimpleLazyObject
+
+from . import badges
 
 
 def global_context(request):
+    # Everything is lazy: pages (and rendered fragments) that never show a
+    # badge or the header avatar never query or touch the cache.
     context = {}
     if request.user.is_authenticated:
-        context['pending_invites_count'] = WorkoutInvite.objects.filter(
-            to_user=request.user, status='pending'
-        ).count()
-        profile = getattr(request.user, 'profile', None)
-        context['user_profile'] = profile
-        context['user_streak'] = profile.current_streak if profile else 0
+        user = request.user
+        bundle = SimpleLazyObject(lambda: badges.get(user.id))
+        context['badges'] = bundle
+        context['pending_invites_count'] = lambda: bundle['pending_invites']
+        context['user_streak'] = lambda: bundle['streak']
+        context['user_profile'] = SimpleLazyObject(lambda: getattr(user, 'profile', None))
     return context
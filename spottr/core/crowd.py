@@ -0,0 +1,184 @@
+"""Live and typical gym crowd levels from member reports.
+
+Reports are appended to CrowdReport and never update the Gym row. The live
+level is the recency-weighted median of the last WINDOW of reports, cached
+per gym for a short while. ``downsample`` (run periodically, from a single
+scheduler) folds closed hours into CrowdHourly, deletes the raw rows and
+refreshes Gym.busy_level as the last-known level; the hourly buckets also
+feed the typical-busyness-by-hour-of-week histogram.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, TruncHour
+from django.utils import timezone
+
+from .models import CrowdHourly, CrowdReport, Gym, Workout
+
+WINDOW = timedelta(minutes=30)
+HALF_LIFE = timedelta(minutes=10)
+HISTORY = timedelta(weeks=12)
+TYPICAL_CACHE_TIMEOUT = 3600
+
+AREAS = [key for key, _ in CrowdReport.AREA_CHOICES]
+# Where a workout of each exercise category puts the member on the gym floor
+CATEGORY_AREAS = {
+    'chest': 'arms', 'back': 'arms', 'shoulders': 'arms', 'arms': 'arms',
+    'legs': 'legs', 'cardio': 'cardio', 'core': 'other',
+}
+
+
+def busy_level(level):
+    """Gym.busy_level key for a 1-5 report level."""
+    return {1: 'low', 2: 'low', 3: 'moderate', 4: 'high'}.get(round(level), 'very_high')
+
+
+def _key(gym_id):
+    return f'crowd:{gym_id}'
+
+
+def _area_for(user):
+    """The gym area of the user's workout from the last few hours, if any."""
+    workout = Workout.objects.filter(
+        user=user, started_at__gte=timezone.now() - timedelta(hours=3)
+    ).order_by('-started_at').first()
+    if workout is None:
+        return ''
+    categories = Counter(workout.workout_exercises.values_list('exercise__category', flat=True))
+    if not categories:
+        return ''
+    return CATEGORY_AREAS.get(categories.most_common(1)[0][0], 'other')
+
+
+def report(gym, user, level):
+    CrowdReport.objects.create(gym=gym, user=user, level=level, area=_area_for(user))
+    cache.delete(_key(gym.id))
+
+
+def _weighted_median(pairs):
+    """Median of ``(value, weight)`` pairs."""
+    pairs = sorted(pairs)
+    half = sum(w for _, w in pairs) / 2
+    running = 0
+    for value, weight in pairs:
+        running += weight
+        if running >= half:
+            return value
+
+
+def _snapshot(reports, now):
+    levels, areas = [], defaultdict(float)
+    for level, area, created_at in reports:
+        weight = 0.5 ** ((now - created_at) / HALF_LIFE)
+        levels.append((level, weight))
+        if area:
+            areas[area] += weight
+    total_area = sum(areas.values())
+    level = _weighted_median(levels) if levels else None
+    return {
+        'reports': len(levels),
+        'level': level,
+        'busy_level': busy_level(level) if level else None,
+        'areas': {a: round(100 * areas[a] / total_area) if total_area else 0 for a in AREAS},
+    }
+
+
+def live(gym_ids):
+    """``{gym_id: snapshot}`` for the given gyms, from one query for any not cached."""
+    gym_ids = list(gym_ids)
+    found = cache.get_many([_key(gid) for gid in gym_ids])
+    result = {gid: found[_key(gid)] for gid in gym_ids if _key(gid) in found}
+    missing = [gid for gid in gym_ids if gid not in result]
+    if missing:
+        now = timezone.now()
+        rows = defaultdict(list)
+        for gym_id, *row in CrowdReport.objects.filter(
+            gym_id__in=missing, created_at__gte=now - WINDOW
+        ).values_list('gym_id', 'level', 'area', 'created_at'):
+            rows[gym_id].append(row)
+        fresh = {gid: _snapshot(rows[gid], now) for gid in missing}
+        cache.set_many({_key(gid): snap for gid, snap in fresh.items()},
+                       getattr(settings, 'SPOTTR_CROWD_CACHE_TIMEOUT', 60))
+        result.update(fresh)
+    return result
+
+
+def apply_live(gyms):
+    """Overlay live busy level and area shares on Gym instances that have recent reports."""
+    gyms = list(gyms)
+    snapshots = live(gym.id for gym in gyms)
+    for gym in gyms:
+        snap = snapshots[gym.id]
+        gym.live_reports = snap['reports']
+        if snap['reports']:
+            gym.busy_level = snap['busy_level']
+            for area, share in snap['areas'].items():
+                setattr(gym, f'{area}_count', share)
+    return gyms
+
+
+def typical_by_hour(gym_id):
+    """Average report level for each hour of the week: 7 lists (Monday first) of 24 values or None."""
+    key = f'crowd:typical:{gym_id}'
+    grid = cache.get(key)
+    if grid is None:
+        grid = [[None] * 24 for _ in range(7)]
+        rows = CrowdHourly.objects.filter(
+            gym_id=gym_id, hour__gte=timezone.now() - HISTORY
+        ).annotate(
+            weekday=ExtractIsoWeekDay('hour'), hod=ExtractHour('hour')
+        ).values('weekday', 'hod').annotate(n=Sum('reports'), total=Sum('level_sum'))
+        for row in rows:
+            grid[row['weekday'] - 1][row['hod']] = round(row['total'] / row['n'], 1)
+        cache.set(key, grid, TYPICAL_CACHE_TIMEOUT)
+    return grid
+
+
+def downsample(now=None):
+    """Fold reports from closed hours outside the live window into CrowdHourly. Returns reports folded."""
+    now = now or timezone.now()
+    cutoff = (now - WINDOW).replace(minute=0, second=0, microsecond=0)
+    with transaction.atomic():
+        old = CrowdReport.objects.filter(created_at__lt=cutoff)
+        last_id = old.aggregate(m=Max('id'))['m']
+        if last_id is None:
+            return 0
+        batch = old.filter(id__lte=last_id)
+        buckets = {
+            (row['gym_id'], row['hour']): row
+            for row in batch.annotate(hour=TruncHour('created_at')).values('gym_id', 'hour').annotate(
+                n=Count('id'), total=Sum('level'))
+        }
+        gym_ids = {gym_id for gym_id, _ in buckets}
+        existing = {
+            (b.gym_id, b.hour): b
+            for b in CrowdHourly.objects.filter(gym_id__in=gym_ids, hour__in={h for _, h in buckets})
+        }
+        new, changed = [], []
+        for key, row in buckets.items():
+            bucket = existing.get(key)
+            if bucket is None:
+                new.append(CrowdHourly(gym_id=key[0], hour=key[1], reports=row['n'], level_sum=row['total']))
+            else:
+                bucket.reports += row['n']
+                bucket.level_sum += row['total']
+                changed.append(bucket)
+        CrowdHourly.objects.bulk_create(new, batch_size=1000)
+        CrowdHourly.objects.bulk_update(changed, ['reports', 'level_sum'], batch_size=1000)
+
+        # Last-known level for pages and gyms without live reports
+        latest = {}
+        for (gym_id, hour), row in sorted(buckets.items(), key=lambda item: item[0][1]):
+            latest[gym_id] = busy_level(row['total'] / row['n'])
+        gyms = list(Gym.objects.filter(id__in=latest).only('id', 'busy_level'))
+        for gym in gyms:
+            gym.busy_level = latest[gym.id]
+        Gym.objects.bulk_update(gyms, ['busy_level'], batch_size=1000)
+
+        folded, _ = batch.delete()
+    cache.delete_many([f'crowd:typical:{gym_id}' for gym_id in gym_ids])
+    return folded
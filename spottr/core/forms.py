@@ -1,3 +1,5 @@
+import zoneinfo
+
 from django import forms
 from django.contrib.auth.models import User
 from .models import Profile, Post, Comment, Group, Message, WorkoutInvite, Workout, WorkoutTemplate
@@ -121,14 +123,26 @@ class PreferencesForm(forms.Form):
 class ProfileEditForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['display_name', 'bio', 'avatar', 'avatar_emoji']
+        fields = ['display_name', 'bio', 'avatar', 'avatar_emoji', 'timezone']
         widgets = {
             'display_name': forms.TextInput(attrs={'class': 'form-input'}),
             'bio': forms.Textarea(attrs={'class': 'form-input', 'rows': 3, 'maxlength': 150}),
             'avatar': forms.FileInput(attrs={'class': 'form-input'}),
             'avatar_emoji': forms.TextInput(attrs={'class': 'form-input'}),
+            'timezone': forms.HiddenInput(),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['timezone'].required = False
+
+    def clean_timezone(self):
+        # Filled in by the browser; keep the stored zone if it sent nothing usable
+        name = self.cleaned_data.get('timezone')
+        if name not in zoneinfo.available_timezones():
+            return self.instance.timezone
+        return name
+
 
 class QuickCheckinForm(forms.Form):
     image = forms.ImageField(
@@ -225,10 +239,14 @@ class GroupForm(forms.Form):
 
 class JoinGroupForm(forms.Form):
     join_code = forms.CharField(
-        max_length=20,
-        widget=forms.TextInput(attrs={'class': 'form-input', 'placeholder': 'Enter group code'})
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-input', 'placeholder': 'Enter group code(s)'})
     )
 
+    def clean_join_code(self):
+        # Several codes may be pasted at once, separated by commas or spaces
+        return self.cleaned_data['join_code'].replace(',', ' ').split()
+
 
 class MessageForm(forms.Form):
     content = forms.CharField(
@@ -0,0 +1,94 @@
+"""Nearest-gym search on a lat/long grid, without PostGIS.
+
+Every gym stores the integer cell it falls in (``cell_lat``, ``cell_lng``,
+CELL_DEGREES on a side), covered by one composite index. A search scans a
+box of cells around the user, growing it until the k-th closest gym found
+is nearer than the box edge or the box covers the search radius, then ranks
+candidates by haversine distance. The box is wider in longitude than in
+latitude by 1/cos(latitude), so it stays roughly square in miles.
+Longitude wrap-around at the antimeridian is not handled.
+"""
+import math
+
+from .models import Gym
+
+CELL_DEGREES = 0.1  # about 7 miles of latitude
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.0
+DEFAULT_K = 10
+MAX_MILES = 100
+MAX_BOX_DEGREES = 2
+MAX_LATITUDE = 89.9  # keeps cos(latitude) above zero
+LNG_HALF_CELLS = round(180 / CELL_DEGREES)  # a longitude radius this wide spans the globe
+
+
+def cell_for(latitude, longitude):
+    return math.floor(latitude / CELL_DEGREES), math.floor(longitude / CELL_DEGREES)
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def _lng_radius(latitude, radius):
+    """Cells of longitude spanning at least the miles of ``radius`` cells of latitude."""
+    poleward = min(abs(latitude) + (radius + 1) * CELL_DEGREES, MAX_LATITUDE)
+    return min(math.ceil(radius / math.cos(math.radians(poleward))), LNG_HALF_CELLS)
+
+
+def _covered_miles(latitude, longitude, cell_lat, cell_lng, radius, lng_radius):
+    """Distance from the point to the nearest edge of the searched box of cells."""
+    lat_lo, lat_hi = (cell_lat - radius) * CELL_DEGREES, (cell_lat + radius + 1) * CELL_DEGREES
+    covered = min(latitude - lat_lo, lat_hi - latitude) * MILES_PER_DEGREE
+    if lng_radius < LNG_HALF_CELLS:  # otherwise every longitude is in the box
+        lng_lo, lng_hi = (cell_lng - lng_radius) * CELL_DEGREES, (cell_lng + lng_radius + 1) * CELL_DEGREES
+        # Degrees of longitude are shortest on the box's poleward edge
+        lng_scale = math.cos(math.radians(min(max(abs(lat_lo), abs(lat_hi)), MAX_LATITUDE)))
+        covered = min(covered, min(longitude - lng_lo, lng_hi - longitude) * MILES_PER_DEGREE * lng_scale)
+    return covered
+
+
+def nearest(latitude, longitude, k=DEFAULT_K, max_miles=MAX_MILES, queryset=None):
+    """Up to ``k`` gyms within ``max_miles``, closest first, each with ``distance_miles`` set."""
+    queryset = queryset if queryset is not None else Gym.objects.all()
+    cell_lat, cell_lng = cell_for(latitude, longitude)
+    # Past this many cells of latitude the box holds every gym within max_miles
+    max_radius = max(math.ceil(max_miles / (MILES_PER_DEGREE * CELL_DEGREES)), 1)
+    radius = 1
+    while True:
+        lng_radius = _lng_radius(latitude, radius)
+        candidates = list(queryset.filter(
+            cell_lat__gte=cell_lat - radius, cell_lat__lte=cell_lat + radius,
+            cell_lng__gte=cell_lng - lng_radius, cell_lng__lte=cell_lng + lng_radius,
+        ))
+        for gym in candidates:
+            gym.distance_miles = haversine_miles(latitude, longitude, gym.latitude, gym.longitude)
+        candidates = sorted((g for g in candidates if g.distance_miles <= max_miles), key=lambda g: g.distance_miles)
+        covered = _covered_miles(latitude, longitude, cell_lat, cell_lng, radius, lng_radius)
+        if radius >= max_radius or covered >= max_miles or (
+            len(candidates) >= k and candidates[k - 1].distance_miles <= covered
+        ):
+            return candidates[:k]
+        radius = min(radius * 2, max_radius)
+
+
+def box_cells(south, west, north, east):
+    """The block of cells covering a viewport, as ``(lat_lo, lng_lo, lat_hi, lng_hi)`` cell numbers.
+
+    Nearby viewports snap to the same block, so it doubles as a cache key.
+    Returns None for an inverted box or one wider than MAX_BOX_DEGREES.
+    """
+    if not (south <= north and west <= east):
+        return None
+    if north - south > MAX_BOX_DEGREES or east - west > MAX_BOX_DEGREES:
+        return None
+    return cell_for(south, west) + cell_for(north, east)
+
+
+def in_cells(lat_lo, lng_lo, lat_hi, lng_hi):
+    return Gym.objects.filter(
+        cell_lat__gte=lat_lo, cell_lat__lte=lat_hi,
+        cell_lng__gte=lng_lo, cell_lng__lte=lng_hi,
+    )
@@ -0,0 +1,123 @@
+"""Group creation and bulk membership changes.
+
+Members are resolved in one query and added with one bulk_create that
+ignores existing memberships, so adding a whole class costs the same few
+queries as adding one person. The group rows are locked first, so
+concurrent joins queue up, and Group.member_count is recounted from the
+membership rows in the same transaction.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Group, GroupMembership
+
+
+def resolve_users(identifiers):
+    """Map user IDs, usernames or emails to users in one query.
+
+    Returns ``(users_by_identifier, unknown_identifiers)``.
+    """
+    identifiers = {str(i).strip() for i in identifiers if str(i).strip()}
+    ids = {int(i) for i in identifiers if i.isdigit()}
+    users = User.objects.filter(Q(id__in=ids) | Q(username__in=identifiers) | Q(email__in=identifiers))
+    found = {}
+    for user in users.only('id', 'username', 'email'):
+        for key in (str(user.id), user.username, user.email):
+            if key in identifiers:
+                found[key] = user
+    return found, sorted(identifiers - found.keys())
+
+
+def add_members(group, user_ids, admin_ids=()):
+    """Add users to ``group``; existing members are left alone. Returns how many joined."""
+    user_ids = set(user_ids) | set(admin_ids)
+    with transaction.atomic():
+        _lock([group.id])
+        existing = set(GroupMembership.objects.filter(
+            group=group, user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+        added = user_ids - existing
+        GroupMembership.objects.bulk_create([
+            GroupMembership(group=group, user_id=user_id, is_admin=user_id in admin_ids)
+            for user_id in added
+        ], ignore_conflicts=True)
+        if added:
+            _recount([group.id])
+    return len(added)
+
+
+@transaction.atomic
+def create_group(creator, name, description='', member_ids=()):
+    group = Group.objects.create(name=name, description=description, creator=creator)
+    valid_ids = User.objects.filter(id__in=member_ids).values_list('id', flat=True)
+    add_members(group, valid_ids, admin_ids={creator.id})
+    return group
+
+
+def join_by_codes(user, codes):
+    """Join every group whose join code is in ``codes``. Returns the groups found."""
+    groups = list(Group.objects.filter(join_code__in=codes))
+    with transaction.atomic():
+        _lock([group.id for group in groups])
+        existing = set(GroupMembership.objects.filter(
+            user=user, group__in=groups
+        ).values_list('group_id', flat=True))
+        joined = [group.id for group in groups if group.id not in existing]
+        GroupMembership.objects.bulk_create([
+            GroupMembership(group_id=group_id, user=user) for group_id in joined
+        ], ignore_conflicts=True)
+        _recount(joined)
+    return groups
+
+
+@transaction.atomic
+def import_memberships(rows):
+    """Bulk-add ``(join code, user identifier, is_admin)`` rows.
+
+    Returns ``(added, unknown_groups, unknown_users)``. Everything is
+    resolved up front, so the query count does not grow with the rows.
+    """
+    rows = list(rows)
+    groups = {g.join_code: g for g in Group.objects.filter(join_code__in={code for code, _, _ in rows})}
+    users, unknown_users = resolve_users(ident for _, ident, _ in rows)
+
+    wanted = {}
+    unknown_groups = set()
+    for code, ident, is_admin in rows:
+        group = groups.get(code)
+        if group is None:
+            unknown_groups.add(code)
+            continue
+        user = users.get(str(ident).strip())
+        if user is not None:
+            key = (group.id, user.id)
+            wanted[key] = wanted.get(key, False) or is_admin
+
+    _lock({group_id for group_id, _ in wanted})
+    existing = set()
+    if wanted:
+        existing = set(GroupMembership.objects.filter(
+            group_id__in={g for g, _ in wanted}, user_id__in={u for _, u in wanted}
+        ).values_list('group_id', 'user_id'))
+    new = [
+        GroupMembership(group_id=group_id, user_id=user_id, is_admin=is_admin)
+        for (group_id, user_id), is_admin in wanted.items() if (group_id, user_id) not in existing
+    ]
+    GroupMembership.objects.bulk_create(new, batch_size=1000, ignore_conflicts=True)
+    _recount({m.group_id for m in new})
+    return len(new), sorted(unknown_groups), unknown_users
+
+
+def _lock(group_ids):
+    """Lock the groups' rows until the end of the transaction."""
+    list(Group.objects.select_for_update().filter(id__in=group_ids).order_by('id').values_list('id', flat=True))
+
+
+def _recount(group_ids):
+    """Set member_count from the membership rows; call inside the transaction that changed them."""
+    members = GroupMembership.objects.filter(
+        group=OuterRef('pk')
+    ).order_by().values('group').annotate(n=Count('id')).values('n')
+    Group.objects.filter(id__in=group_ids).update(member_count=Coalesce(Subquery(members), 0))
@@ -0,0 +1,37 @@
+"""Gym membership changes that keep Gym.member_count in step.
+
+A user has at most one active gym. Every change moves the counters with
+F() updates inside the same transaction as the membership rows.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import Gym, GymMembership
+
+
+def _deactivate(user, keep=None):
+    active = GymMembership.objects.select_for_update().filter(user=user, is_active=True)
+    if keep is not None:
+        active = active.exclude(gym=keep)
+    gym_ids = list(active.values_list('gym_id', flat=True))
+    if gym_ids:
+        GymMembership.objects.filter(user=user, gym_id__in=gym_ids).update(is_active=False)
+        # A counter that drifted to 0 stays there (the field is unsigned) until rebuild_member_counts
+        Gym.objects.filter(id__in=gym_ids, member_count__gt=0).update(member_count=F('member_count') - 1)
+
+
+@transaction.atomic
+def join(user, gym):
+    _deactivate(user, keep=gym)
+    membership, created = GymMembership.objects.get_or_create(user=user, gym=gym, defaults={'is_active': True})
+    if not created:
+        if membership.is_active:
+            return
+        membership.is_active = True
+        membership.save(update_fields=['is_active'])
+    Gym.objects.filter(id=gym.id).update(member_count=F('member_count') + 1)
+
+
+@transaction.atomic
+def leave(user):
+    _deactivate(user)
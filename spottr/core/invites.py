@@ -0,0 +1,94 @@
+"""Workout invites to friends and gym members.
+
+Recipients are resolved in one query and direct invites are written with a
+single bulk_create. A gym invite reaching more members than
+``SPOTTR_INVITE_BROADCAST_THRESHOLD`` is stored once as a broadcast (no
+``to_user``); each member's answer becomes an InviteResponse row only when
+they respond, so posting to a huge gym is still one INSERT.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from . import badges
+from .models import GymMembership, InviteResponse, WorkoutInvite
+
+
+def broadcast_threshold():
+    return getattr(settings, 'SPOTTR_INVITE_BROADCAST_THRESHOLD', 100)
+
+
+def invite_gym(from_user, gym, **fields):
+    """Invite every active member of ``gym``. Returns how many members were reached."""
+    recipients = list(GymMembership.objects.filter(
+        gym=gym, is_active=True
+    ).exclude(user=from_user).values_list('user_id', flat=True))
+    if len(recipients) > broadcast_threshold():
+        WorkoutInvite.objects.create(from_user=from_user, gym=gym, invite_type='gym', **fields)
+    else:
+        WorkoutInvite.objects.bulk_create([
+            WorkoutInvite(from_user=from_user, to_user_id=user_id, gym=gym, invite_type='gym', **fields)
+            for user_id in recipients
+        ])
+    badges.invalidate(*recipients)
+    return len(recipients)
+
+
+def invite_users(from_user, user_ids, **fields):
+    """Send a friend invite to each existing user in ``user_ids``. Returns how many were sent."""
+    ids = [int(uid) for uid in user_ids if str(uid).isdigit()]
+    recipients = list(User.objects.filter(id__in=ids).exclude(id=from_user.id).values_list('id', flat=True))
+    WorkoutInvite.objects.bulk_create([
+        WorkoutInvite(from_user=from_user, to_user_id=user_id, invite_type='friend', **fields)
+        for user_id in recipients
+    ])
+    badges.invalidate(*recipients)
+    return len(recipients)
+
+
+def _open_broadcasts(user_id):
+    return WorkoutInvite.objects.filter(
+        to_user__isnull=True, status='pending',
+        gym__memberships__user_id=user_id, gym__memberships__is_active=True,
+    ).exclude(from_user_id=user_id).exclude(responses__user_id=user_id)
+
+
+def gym_board(user, gym):
+    """Pending invites on ``gym``'s board that ``user`` can still answer."""
+    return WorkoutInvite.objects.filter(gym=gym, status='pending').filter(
+        Q(to_user=user) | Q(to_user__isnull=True)
+    ).exclude(from_user=user).exclude(responses__user=user)
+
+
+def pending_count(user_id):
+    direct = WorkoutInvite.objects.filter(to_user_id=user_id, status='pending').count()
+    return direct + _open_broadcasts(user_id).count()
+
+
+def answerable(user):
+    """Pending invites ``user`` may respond to: their own plus broadcasts to their gyms."""
+    return WorkoutInvite.objects.filter(status='pending').filter(
+        Q(to_user=user) |
+        Q(to_user__isnull=True, gym__memberships__user=user, gym__memberships__is_active=True)
+    ).distinct()
+
+
+@transaction.atomic
+def respond(invite, user, accept):
+    """Answer ``invite``. Returns the answer, or 'closed' if the invite closed first."""
+    status = 'accepted' if accept else 'declined'
+    # Lock the invite so concurrent accepts can't claim more than its spots
+    invite = WorkoutInvite.objects.select_for_update().get(id=invite.id)
+    if invite.status != 'pending':
+        return 'closed'
+    if invite.is_broadcast:
+        InviteResponse.objects.update_or_create(invite=invite, user=user, defaults={'status': status})
+        if accept and invite.responses.filter(status='accepted').count() >= invite.spots:
+            # Every spot is taken; close the broadcast for everyone else
+            WorkoutInvite.objects.filter(id=invite.id).update(status='accepted')
+    else:
+        invite.status = status
+        invite.save(update_fields=['status'])
+    badges.invalidate(user.id)
+    return status
@@ -0,0 +1,186 @@
+"""Leaderboard ranking for a cohort of users (gym members or friends).
+
+Every metric is computed in SQL in a single annotated query over User, so
+ordering, paging and the current user's rank never touch Python loops.
+``snapshot`` freezes those rankings into LeaderboardSnapshot rows, which
+``build_from_snapshot`` serves as plain indexed reads.
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LeaderboardSnapshot
+
+METRICS = [
+    ('streak', 'Streak'),
+    ('weekly_workouts', 'This Week'),
+    ('level', 'Level'),
+    ('volume', 'Volume'),
+]
+DEFAULT_METRIC = 'streak'
+PAGE_SIZE = 25
+AROUND_ME = 2
+
+# (minimum lifetime workouts, level), highest first
+LEVELS = [(500, 50), (200, 40), (100, 30), (50, 20), (20, 10), (5, 5)]
+
+
+def _level_expression():
+    return Case(
+        *[When(total_workouts__gte=minimum, then=Value(level)) for minimum, level in LEVELS],
+        default=Value(1), output_field=IntegerField(),
+    )
+
+
+def annotate_metrics(queryset, now=None):
+    week_start = (now or timezone.now()) - timedelta(days=7)
+    return queryset.annotate(
+        weekly_workouts=Count(
+            'workouts', filter=Q(workouts__completed=True, workouts__started_at__gte=week_start)
+        ),
+        streak=Coalesce(F('profile__current_streak'), 0),
+        total_workouts=Coalesce(F('stats__total_workouts'), 0),
+        volume=Coalesce(F('stats__total_weight'), 0, output_field=FloatField()),
+    ).annotate(level=_level_expression())
+
+
+def ranked(cohort, metric=DEFAULT_METRIC, now=None):
+    """Users in ``cohort`` (IDs or a values('user_id') subquery), best first."""
+    if metric not in dict(METRICS):
+        metric = DEFAULT_METRIC
+    queryset = User.objects.filter(id__in=cohort).select_related('profile')
+    return annotate_metrics(queryset, now).order_by(F(metric).desc(), 'id')
+
+
+def rank_of(queryset, metric, user):
+    """1-based position of ``user`` in an already ``ranked`` queryset, or None."""
+    mine = queryset.filter(id=user.id).values_list(metric, flat=True).first()
+    if mine is None:
+        return None
+    ahead = queryset.filter(Q(**{f'{metric}__gt': mine}) | Q(**{metric: mine, 'id__lt': user.id}))
+    return ahead.count() + 1
+
+
+def build(cohort, user, metric=DEFAULT_METRIC, page=1, size=PAGE_SIZE):
+    """One page of the leaderboard plus a window of rows around ``user``."""
+    if metric not in dict(METRICS):
+        metric = DEFAULT_METRIC
+    queryset = ranked(cohort, metric)
+    page_obj = Paginator(queryset, size).get_page(page)
+    entries = _entries(page_obj.object_list, page_obj.start_index(), user)
+
+    around_me = []
+    my_rank = rank_of(queryset, metric, user)
+    if my_rank is not None and not any(e['is_current_user'] for e in entries):
+        offset = max(0, my_rank - 1 - AROUND_ME)
+        around_me = _entries(queryset[offset:my_rank + AROUND_ME], offset + 1, user)
+
+    return {
+        'entries': entries,
+        'around_me': around_me,
+        'my_rank': my_rank,
+        'metric': metric,
+        'page': page_obj,
+    }
+
+
+def _entries(users, first_rank, current_user):
+    return [{
+        'user': u,
+        'profile': u.profile,
+        'weekly_workouts': u.weekly_workouts,
+        'streak': u.streak,
+        'level': u.level,
+        'volume': u.volume,
+        'is_current_user': u.id == current_user.id,
+        'rank': first_rank + i,
+        'rank_delta': None,
+    } for i, u in enumerate(users)]
+
+
+# ─── Snapshots ───────────────────────────────────────────────────────────────
+
+def period_start(period, today=None):
+    today = today or timezone.localdate()
+    if period == 'weekly':
+        return today - timedelta(days=today.weekday())
+    return today
+
+
+def snapshot(scope, scope_id, cohort, period, start, metrics=None, now=None):
+    """Write the cohort's current rankings for ``start``. Returns rows written."""
+    rows = []
+    for metric in metrics or [m for m, _ in METRICS]:
+        ranking = ranked(cohort, metric, now).values_list('id', metric, 'streak', 'level')
+        rows.extend(
+            LeaderboardSnapshot(
+                user_id=user_id, scope=scope, scope_id=scope_id, period=period,
+                period_start=start, metric=metric, rank=i + 1, value=value, streak=streak, level=level,
+            )
+            for i, (user_id, value, streak, level) in enumerate(ranking)
+        )
+    LeaderboardSnapshot.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['scope', 'scope_id', 'period', 'metric', 'period_start', 'user'],
+        update_fields=['rank', 'value', 'streak', 'level'],
+    )
+    return len(rows)
+
+
+def build_from_snapshot(scope, scope_id, user, metric=DEFAULT_METRIC, period='daily', page=1, size=PAGE_SIZE):
+    """Same shape as ``build`` but read from the latest snapshot; None if there is none."""
+    if metric not in dict(METRICS):
+        metric = DEFAULT_METRIC
+    board = LeaderboardSnapshot.objects.filter(scope=scope, scope_id=scope_id, period=period, metric=metric)
+    starts = list(board.order_by('-period_start').values_list('period_start', flat=True).distinct()[:2])
+    if not starts or starts[0] < period_start(period) - timedelta(days=1):
+        return None
+
+    current = board.filter(period_start=starts[0]).select_related('user', 'user__profile')
+    page_obj = Paginator(current.order_by('rank'), size).get_page(page)
+    rows = list(page_obj.object_list)
+
+    my_rank = current.filter(user=user).values_list('rank', flat=True).first()
+    around = []
+    if my_rank is not None and not any(r.user_id == user.id for r in rows):
+        around = list(current.filter(
+            rank__gte=my_rank - AROUND_ME, rank__lte=my_rank + AROUND_ME
+        ).order_by('rank'))
+
+    previous = {}
+    if len(starts) > 1:
+        previous = dict(board.filter(
+            period_start=starts[1], user_id__in=[r.user_id for r in rows + around]
+        ).values_list('user_id', 'rank'))
+
+    return {
+        'entries': _snapshot_entries(rows, previous, user),
+        'around_me': _snapshot_entries(around, previous, user),
+        'my_rank': my_rank,
+        'metric': metric,
+        'page': page_obj,
+        'as_of': starts[0],
+    }
+
+
+def _snapshot_entries(rows, previous, current_user):
+    entries = []
+    for row in rows:
+        profile = row.user.profile
+        prev_rank = previous.get(row.user_id)
+        entries.append({
+            'user': row.user,
+            'profile': profile,
+            'weekly_workouts': int(row.value) if row.metric == 'weekly_workouts' else None,
+            'streak': row.streak,
+            'level': row.level,
+            'volume': row.value if row.metric == 'volume' else None,
+            'is_current_user': row.user_id == current_user.id,
+            'rank': row.rank,
+            'rank_delta': prev_rank - row.rank if prev_rank is not None else None,
+        })
+    return entries
@@ -0,0 +1,15 @@
+"""Evaluate every achievement for every user, e.g. after adding a new achievement."""
+from django.core.management.base import BaseCommand
+
+from core.achievements import backfill
+
+
+class Command(BaseCommand):
+    help = 'Recompute UserAchievement progress for all users and achievements in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        unlocked = backfill(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Unlocked {unlocked} achievements'))
@@ -0,0 +1,19 @@
+"""Recompute every group's streak from its members' daily activity.
+
+Intended to run nightly from cron:
+    python manage.py compute_group_streaks
+"""
+from django.core.management.base import BaseCommand
+
+from core.streaks import recompute_groups
+
+
+class Command(BaseCommand):
+    help = 'Write current/best streak and active member counts to GroupStreak for all groups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = recompute_groups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated {written} group streaks'))
@@ -0,0 +1,16 @@
+"""Fold raw gym crowd reports into hourly buckets.
+
+Intended to run from cron every few minutes, from one scheduler only:
+    python manage.py downsample_crowd_reports
+"""
+from django.core.management.base import BaseCommand
+
+from core import crowd
+
+
+class Command(BaseCommand):
+    help = 'Roll crowd reports older than the live window into CrowdHourly and delete them'
+
+    def handle(self, *args, **options):
+        folded = crowd.downsample()
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} crowd reports'))
@@ -0,0 +1,16 @@
+"""Reset streaks that lapsed at their owner's local midnight.
+
+Time zones roll over at different hours, so run it hourly from cron:
+    python manage.py expire_streaks
+"""
+from django.core.management.base import BaseCommand
+
+from core.streaks import expire
+
+
+class Command(BaseCommand):
+    help = 'Zero current streaks with no activity since before yesterday, local time'
+
+    def handle(self, *args, **options):
+        expired = expire()
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} streaks'))
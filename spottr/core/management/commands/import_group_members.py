@@ -0,0 +1,61 @@
+"""Bulk-add members to groups from a CSV or JSON file.
+
+CSV needs a ``user`` column (ID, username or email) and either a ``group``
+column with join codes or ``--group CODE``; an optional ``is_admin`` column
+takes 1/true/yes. JSON is a list of objects with the same keys. For example:
+    python manage.py import_group_members class.csv --group AB12CD34
+    python manage.py import_group_members teams.json
+"""
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.groups import import_memberships
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+class Command(BaseCommand):
+    help = 'Import group memberships from a CSV or JSON file ("-" reads CSV from stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--group', help='Join code to use for rows without a group column')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('json' if path.endswith('.json') else 'csv')
+        try:
+            if path == '-':
+                records = self._read(sys.stdin, fmt)
+            else:
+                with open(path, newline='', encoding='utf-8') as f:
+                    records = self._read(f, fmt)
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+
+        rows = []
+        for i, record in enumerate(records, start=1):
+            code = (record.get('group') or options['group'] or '').strip()
+            user = str(record.get('user') or '').strip()
+            if not code or not user:
+                raise CommandError(f'Row {i}: needs a user and a group (or --group)')
+            rows.append((code, user, str(record.get('is_admin', '')).strip().lower() in TRUE_VALUES))
+
+        added, unknown_groups, unknown_users = import_memberships(rows)
+        for code in unknown_groups:
+            self.stdout.write(self.style.WARNING(f'Unknown group code: {code}'))
+        for ident in unknown_users:
+            self.stdout.write(self.style.WARNING(f'Unknown user: {ident}'))
+        self.stdout.write(self.style.SUCCESS(f'Added {added} memberships from {len(rows)} rows'))
+
+    def _read(self, f, fmt):
+        if fmt == 'json':
+            data = json.load(f)
+            if not isinstance(data, list) or not all(isinstance(r, dict) for r in data):
+                raise ValueError('expected a list of objects')
+            return data
+        return list(csv.DictReader(f))
@@ -0,0 +1,22 @@
+"""Rebuild the per-year activity bitmaps from the workout and post tables."""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core import activity, streaks
+
+
+class Command(BaseCommand):
+    help = 'Rewrite ActivityYear rows for every user (or the given user IDs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+        count = 0
+        for user_id, tz_name in users.values_list('id', 'profile__timezone').iterator():
+            activity.rebuild(user_id, streaks.zone(tz_name or 'UTC'))
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt activity bitmaps for {count} users'))
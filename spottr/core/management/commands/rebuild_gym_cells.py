@@ -0,0 +1,19 @@
+"""Recompute every gym's grid cell, e.g. after a bulk import that bypassed save()."""
+from django.core.management.base import BaseCommand
+
+from core.geo import cell_for
+from core.models import Gym
+
+
+class Command(BaseCommand):
+    help = 'Recompute the nearest-gym search grid cell of every gym'
+
+    def handle(self, *args, **options):
+        stale = []
+        for gym in Gym.objects.only('latitude', 'longitude', 'cell_lat', 'cell_lng').iterator():
+            cell = cell_for(gym.latitude, gym.longitude)
+            if cell != (gym.cell_lat, gym.cell_lng):
+                gym.cell_lat, gym.cell_lng = cell
+                stale.append(gym)
+        Gym.objects.bulk_update(stale, ['cell_lat', 'cell_lng'], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(stale)} gym cells'))
@@ -0,0 +1,28 @@
+"""Reconcile the denormalized Gym.member_count and Group.member_count columns."""
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+
+from core.models import Group, Gym
+
+
+class Command(BaseCommand):
+    help = 'Recount active gym memberships and group memberships where the stored counts drifted'
+
+    def handle(self, *args, **options):
+        stale_gyms = list(Gym.objects.annotate(
+            actual=Count('memberships', filter=Q(memberships__is_active=True))
+        ).exclude(member_count=F('actual')).only('id', 'member_count'))
+        for gym in stale_gyms:
+            gym.member_count = gym.actual
+        Gym.objects.bulk_update(stale_gyms, ['member_count'], batch_size=1000)
+
+        stale_groups = list(Group.objects.annotate(
+            actual=Count('group_members')
+        ).exclude(member_count=F('actual')).only('id', 'member_count'))
+        for group in stale_groups:
+            group.member_count = group.actual
+        Group.objects.bulk_update(stale_groups, ['member_count'], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed {len(stale_gyms)} gym and {len(stale_groups)} group member counts'
+        ))
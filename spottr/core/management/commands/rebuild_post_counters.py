@@ -0,0 +1,53 @@
+"""Rebuild the denormalized reaction/comment counters on Post."""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from core.models import Post, Reaction, Comment
+
+
+COUNTER_FIELDS = [Reaction.counter_field(t) for t, _ in Reaction.REACTION_CHOICES] + ['comment_count']
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post reaction and comment counters from the Reaction and Comment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        counts = defaultdict(dict)
+        reaction_rows = Reaction.objects.values('post_id', 'reaction_type').annotate(n=Count('id')).order_by()
+        for row in reaction_rows:
+            counts[row['post_id']][Reaction.counter_field(row['reaction_type'])] = row['n']
+        comment_rows = Comment.objects.values('post_id').annotate(n=Count('id')).order_by()
+        for row in comment_rows:
+            counts[row['post_id']]['comment_count'] = row['n']
+
+        updated = 0
+        batch = []
+        posts = Post.objects.only('id', *COUNTER_FIELDS).order_by('id')
+        with transaction.atomic():
+            for post in posts.iterator(chunk_size=batch_size):
+                fresh = counts.get(post.id, {})
+                changed = False
+                for field in COUNTER_FIELDS:
+                    value = fresh.get(field, 0)
+                    if getattr(post, field) != value:
+                        setattr(post, field, value)
+                        changed = True
+                if changed:
+                    batch.append(post)
+                if len(batch) >= batch_size:
+                    Post.objects.bulk_update(batch, COUNTER_FIELDS)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                Post.objects.bulk_update(batch, COUNTER_FIELDS)
+                updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} posts'))
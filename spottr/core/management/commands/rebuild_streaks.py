@@ -0,0 +1,16 @@
+"""Recompute current and longest streaks from workout and post history."""
+from django.core.management.base import BaseCommand
+
+from core.streaks import recompute
+
+
+class Command(BaseCommand):
+    help = 'Rederive streaks for every user (or the given user IDs) in their own time zones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = recompute(options['user_ids'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} streaks'))
@@ -0,0 +1,49 @@
+"""Rebuild the materialized friends timelines from Post, Follow and Friendship."""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Post, Profile, TimelineEntry
+from core.timeline import PULL_AUTHORS_CACHE_KEY, audience_ids, fanout_limit
+
+
+class Command(BaseCommand):
+    help = 'Re-materialize friends timelines for posts from the last N days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--clear', action='store_true', help='Delete all timeline entries first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            TimelineEntry.objects.all().delete()
+
+        since = timezone.now() - timedelta(days=options['days'])
+        author_ids = Post.objects.filter(created_at__gte=since).values_list('user_id', flat=True).order_by().distinct()
+        limit = fanout_limit()
+
+        written = 0
+        pulled = []
+        for author_id in author_ids.iterator():
+            audience = audience_ids(author_id)
+            if len(audience) > limit:
+                pulled.append(author_id)
+                continue
+            posts = Post.objects.filter(user_id=author_id, created_at__gte=since).values_list('id', 'created_at')
+            entries = [
+                TimelineEntry(owner_id=uid, post_id=pid, author_id=author_id, created_at=created_at)
+                for pid, created_at in posts
+                for uid in audience
+            ]
+            TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+            written += len(entries)
+
+        Profile.objects.update(fanout_on_read=False)
+        Profile.objects.filter(user_id__in=pulled).update(fanout_on_read=True)
+        cache.delete(PULL_AUTHORS_CACHE_KEY)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} timeline entries; {len(pulled)} authors served on read'
+        ))
@@ -0,0 +1,15 @@
+"""Reconcile chat unread counters with the messages after each read cursor."""
+from django.core.management.base import BaseCommand
+
+from core.unread import recompute
+
+
+class Command(BaseCommand):
+    help = 'Recount unread chat messages for every user (or the given user IDs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        fixed = recompute(options['user_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} unread counters'))
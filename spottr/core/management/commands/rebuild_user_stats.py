@@ -0,0 +1,15 @@
+"""Backfill or reconcile the UserStats lifetime rollups."""
+from django.core.management.base import BaseCommand
+
+from core.stats import recompute
+
+
+class Command(BaseCommand):
+    help = 'Recompute total workouts, sets and weight for every user (or the given user IDs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        written = recompute(options['user_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} users'))
@@ -1,4 +1,5 @@
 """Seed the database with demo data for Spottr."""
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -10,7 +11,7 @@ from core.models import (
     Post, Reaction, Comment, ExerciseDefinition, WorkoutTemplate,
     TemplateExercise, Workout, WorkoutExercise, WorkoutSet,
     PersonalRecord, Group, GroupMembership, Message, WorkoutInvite,
-    Achievement, UserAchievement, GroupStreak,
+    Achievement,
 )
 
 
@@ -65,11 +66,6 @@ class Command(BaseCommand):
                 'display_name': u.first_name or u.username,
                 'avatar_emoji': emojis[i % len(emojis)],
                 'bio': bios[i % len(bios)],
-                'current_streak': random.randint(1, 47),
-                'longest_streak': random.randint(20, 90),
-                'total_workouts': random.randint(50, 300),
-                'total_sets': random.randint(500, 5000),
-                'total_weight': random.randint(100000, 900000),
                 'workout_frequency': random.choice([4, 5, 6]),
                 'status': 'online' if u == demo else random.choice(statuses),
             })
@@ -80,27 +76,26 @@ class Command(BaseCommand):
             Follow.objects.get_or_create(follower=u, following=demo)
         for u in users[1:5]:
             Friendship.objects.get_or_create(
-                user1=min(demo, u, key=lambda x: x.pk),
-                user2=max(demo, u, key=lambda x: x.pk),
+                from_user=demo, to_user=u,
                 defaults={'accepted': True},
             )
 
         # --- Gyms ---
         gyms_data = [
-            ('Iron Paradise Gym', '123 Main St, Downtown', 0.3, 45, 80, 2),
-            ('FitLife Center', '456 Oak Ave, Midtown', 1.2, 62, 120, 3),
-            ('PowerHouse Athletics', '789 Elm Blvd, Uptown', 2.5, 30, 100, 1),
+            ('Iron Paradise Gym', '123 Main St, Downtown', 40.7128, -74.0060, 45, 80, 'moderate'),
+            ('FitLife Center', '456 Oak Ave, Midtown', 40.7549, -73.9840, 62, 120, 'high'),
+            ('PowerHouse Athletics', '789 Elm Blvd, Uptown', 40.7870, -73.9754, 30, 100, 'low'),
         ]
         gyms = []
-        for name, addr, dist, act, cap, busy in gyms_data:
+        for name, addr, lat, lng, act, cap, busy in gyms_data:
             g, _ = Gym.objects.update_or_create(name=name, defaults={
-                'address': addr, 'distance': dist,
+                'address': addr, 'latitude': lat, 'longitude': lng,
                 'current_activity': act, 'max_capacity': cap,
                 'busy_level': busy,
-                'arms_pct': random.randint(15, 30),
-                'legs_pct': random.randint(15, 30),
-                'cardio_pct': random.randint(10, 25),
-                'classes_pct': random.randint(5, 15),
+                'arms_count': random.randint(15, 30),
+                'legs_count': random.randint(15, 30),
+                'cardio_count': random.randint(10, 25),
+                'classes_count': random.randint(5, 15),
             })
             gyms.append(g)
 
@@ -172,7 +167,7 @@ class Command(BaseCommand):
                     'started_at': now - timedelta(days=days_ago, hours=1),
                     'completed_at': now - timedelta(days=days_ago),
                     'completed': True,
-                    'duration_seconds': random.randint(2400, 5400),
+                    'duration_minutes': random.randint(40, 90),
                 }
             )
             if created:
@@ -194,36 +189,32 @@ class Command(BaseCommand):
         for ex, wt in zip(pr_exercises, pr_weights):
             PersonalRecord.objects.get_or_create(
                 user=demo, exercise=ex,
-                defaults={'weight': wt, 'date_achieved': now - timedelta(days=random.randint(1, 30))}
+                defaults={'weight': wt, 'achieved_at': now - timedelta(days=random.randint(1, 30))}
             )
 
         # --- Posts ---
         post_data = [
             {'user': demo, 'post_type': 'workout', 'content': 'Crushed push day today! Bench felt smooth.',
-             'workout_name': 'Push Day', 'exercises_count': 4, 'sets_count': 16, 'duration_display': '1h 15m'},
+             'workout': Workout.objects.filter(user=demo, name='Workout 1d ago').first()},
             {'user': users[1], 'post_type': 'pr', 'content': 'New bench PR! Been chasing this for months.',
              'pr_exercise': 'Bench Press', 'pr_weight': 315},
             {'user': users[2], 'post_type': 'streak', 'content': 'Can\'t stop won\'t stop!', 'streak_days': 30},
             {'user': users[3], 'post_type': 'checkin', 'content': 'Morning session at Iron Paradise.',
              'location': 'Iron Paradise Gym'},
             {'user': demo, 'post_type': 'workout', 'content': 'Leg day done. Walking is overrated anyway.',
-             'workout_name': 'Leg Day', 'exercises_count': 5, 'sets_count': 20, 'duration_display': '1h 20m'},
+             'workout': Workout.objects.filter(user=demo, name='Workout 0d ago').first()},
             {'user': users[4], 'post_type': 'pr', 'content': '500lb deadlift club!',
              'pr_exercise': 'Deadlift', 'pr_weight': 500},
             {'user': users[5], 'post_type': 'checkin', 'content': 'Early bird gets the gains.',
              'location': 'FitLife Center'},
-            {'user': users[1], 'post_type': 'workout', 'content': 'Upper body pump session.',
-             'workout_name': 'Upper Body', 'exercises_count': 5, 'sets_count': 20, 'duration_display': '1h 30m'},
+            {'user': users[1], 'post_type': 'workout', 'content': 'Upper body pump session.'},
         ]
         for i, pd in enumerate(post_data):
             p, created = Post.objects.get_or_create(
                 user=pd['user'], content=pd['content'],
                 defaults={
                     'post_type': pd['post_type'],
-                    'workout_name': pd.get('workout_name', ''),
-                    'exercises_count': pd.get('exercises_count', 0),
-                    'sets_count': pd.get('sets_count', 0),
-                    'duration_display': pd.get('duration_display', ''),
+                    'workout': pd.get('workout'),
                     'pr_exercise': pd.get('pr_exercise', ''),
                     'pr_weight': pd.get('pr_weight'),
                     'streak_days': pd.get('streak_days'),
@@ -295,16 +286,16 @@ class Command(BaseCommand):
 
         # --- Workout Invites ---
         WorkoutInvite.objects.get_or_create(
-            sender=users[1], gym=gyms[0],
+            from_user=users[1], gym=gyms[0], invite_type='gym',
             defaults={
-                'activity_type': 'Push Day', 'spots': 2,
+                'workout_type': 'Push Day', 'spots': 2,
                 'scheduled_time': now + timedelta(hours=3),
             }
         )
         WorkoutInvite.objects.get_or_create(
-            sender=users[2], gym=gyms[0],
+            from_user=users[2], gym=gyms[0], invite_type='gym',
             defaults={
-                'activity_type': 'Leg Day', 'spots': 3,
+                'workout_type': 'Leg Day', 'spots': 3,
                 'scheduled_time': now + timedelta(hours=5),
             }
         )
@@ -319,37 +310,22 @@ class Command(BaseCommand):
             ('Social Butterfly', 'Make 10 friends', '🦋', 'friends', 10),
         ]
         for aname, desc, icon, req_type, req_val in achievements_data:
-            a, _ = Achievement.objects.get_or_create(
+            Achievement.objects.get_or_create(
                 name=aname, defaults={
                     'description': desc, 'icon': icon,
                     'requirement_type': req_type, 'requirement_value': req_val,
                 }
             )
-            profile = demo.profile
-            if req_type == 'workouts':
-                progress = min(profile.total_workouts, req_val)
-            elif req_type == 'streak':
-                progress = min(profile.current_streak, req_val)
-            else:
-                progress = min(Follow.objects.filter(follower=demo).count(), req_val)
 
-            UserAchievement.objects.update_or_create(
-                user=demo, achievement=a,
-                defaults={
-                    'progress': progress,
-                    'unlocked': progress >= req_val,
-                    'unlocked_at': now if progress >= req_val else None,
-                }
-            )
-
-        # --- Group Streaks ---
-        for g in Group.objects.filter(creator=demo):
-            GroupStreak.objects.update_or_create(
-                group=g, defaults={
-                    'current_streak': random.randint(5, 20),
-                    'active_members': GroupMembership.objects.filter(group=g).count(),
-                }
-            )
+        # --- Denormalized counters and rollups ---
+        # Everything above writes rows directly, so rebuild what the services
+        # would have kept in step (this also unlocks achievements and streaks).
+        for command in [
+            'rebuild_post_counters', 'rebuild_user_stats', 'rebuild_timelines',
+            'rebuild_unread_counts', 'rebuild_member_counts', 'rebuild_activity_bitmaps',
+            'rebuild_streaks', 'compute_group_streaks', 'backfill_achievements',
+        ]:
+            call_command(command, stdout=self.stdout)
 
         self.stdout.write(self.style.SUCCESS(
             f'Seeded: {User.objects.count()} users, {Post.objects.count()} posts, '
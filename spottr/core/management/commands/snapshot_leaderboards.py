@@ -0,0 +1,46 @@
+"""Snapshot gym and friends leaderboards for the current day or week.
+
+Intended to run from cron, e.g. daily just after midnight:
+    python manage.py snapshot_leaderboards --period daily
+    python manage.py snapshot_leaderboards --period weekly
+"""
+from django.core.management.base import BaseCommand
+
+from core import leaderboard, social
+from core.models import GymMembership, LeaderboardSnapshot, Profile
+
+
+class Command(BaseCommand):
+    help = 'Write LeaderboardSnapshot rows for every gym and every friends board'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=['daily', 'weekly'], default='daily')
+        parser.add_argument('--scope', choices=['gym', 'friends', 'all'], default='all')
+        parser.add_argument('--keep', type=int, default=8, help='Snapshots to keep per board and period')
+
+    def handle(self, *args, **options):
+        period = options['period']
+        start = leaderboard.period_start(period)
+        written = 0
+
+        if options['scope'] in ('gym', 'all'):
+            gym_ids = GymMembership.objects.filter(is_active=True).values_list('gym_id', flat=True).distinct()
+            for gym_id in gym_ids.iterator():
+                cohort = GymMembership.objects.filter(gym_id=gym_id, is_active=True).values('user_id')
+                written += leaderboard.snapshot('gym', gym_id, cohort, period, start)
+
+        if options['scope'] in ('friends', 'all'):
+            for user_id in Profile.objects.values_list('user_id', flat=True).iterator():
+                friends = social.friend_ids(user_id)
+                if friends:
+                    written += leaderboard.snapshot('friends', user_id, friends | {user_id}, period, start)
+
+        # Keep the last few periods so rank deltas have something to compare to
+        starts = list(
+            LeaderboardSnapshot.objects.filter(period=period)
+            .order_by('-period_start').values_list('period_start', flat=True).distinct()
+        )
+        if len(starts) > options['keep']:
+            LeaderboardSnapshot.objects.filter(period=period, period_start__lt=starts[options['keep'] - 1]).delete()
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} {period} snapshot rows for {start}'))
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Sum
 import json
+import uuid
 
 
 class Profile(models.Model):
@@ -17,6 +18,11 @@ class Profile(models.Model):
     current_streak = models.IntegerField(default=0)
     longest_streak = models.IntegerField(default=0)
     last_workout_date = models.DateField(null=True, blank=True)
+    timezone = models.CharField(max_length=64, default='UTC', help_text='IANA zone that streak days are counted in')
+    fanout_on_read = models.BooleanField(
+        default=False, help_text='Too many followers to fan posts out on write; readers pull them instead'
+    )
+    sync_version = models.PositiveBigIntegerField(default=0, help_text='Last version handed out to SyncChange rows')
     created_at = models.DateTimeField(auto_now_add=True)
 
     STATUS_CHOICES = [
@@ -29,42 +35,67 @@ class Profile(models.Model):
     def __str__(self):
         return self.display_name or self.user.username
 
+    @property
+    def stats(self):
+        try:
+            return self.user.stats
+        except UserStats.DoesNotExist:
+            return UserStats(user=self.user)
+
     @property
     def total_workouts(self):
-        return self.user.workouts.filter(completed=True).count()
+        return self.stats.total_workouts
 
     @property
     def total_sets(self):
-        from django.db.models import Count
-        return WorkoutSet.objects.filter(
-            workout_exercise__workout__user=self.user,
-            workout_exercise__workout__completed=True,
-            completed=True
-        ).count()
+        return self.stats.total_sets
 
     @property
     def total_weight(self):
-        result = WorkoutSet.objects.filter(
-            workout_exercise__workout__user=self.user,
-            workout_exercise__workout__completed=True,
-            completed=True
-        ).aggregate(total=Sum('weight'))
-        return result['total'] or 0
+        return self.stats.total_weight
 
     @property
     def friends_count(self):
-        return Friendship.objects.filter(
-            models.Q(from_user=self.user) | models.Q(to_user=self.user),
-            accepted=True
-        ).count()
+        from .social import friend_ids
+        return len(friend_ids(self.user_id))
 
     @property
     def followers_count(self):
-        return Follow.objects.filter(following=self.user).count()
+        from .social import follower_ids
+        return len(follower_ids(self.user_id))
 
     @property
     def following_count(self):
-        return Follow.objects.filter(follower=self.user).count()
+        from .social import following_ids
+        return len(following_ids(self.user_id))
+
+
+class UserStats(models.Model):
+    """Lifetime workout totals, kept current by core.stats."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+    total_workouts = models.PositiveIntegerField(default=0)
+    total_sets = models.PositiveIntegerField(default=0)
+    total_weight = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "user stats"
+
+    def __str__(self):
+        return f"{self.user.username}: {self.total_workouts} workouts"
+
+
+class ActivityYear(models.Model):
+    """One bit per day of ``year`` (bit n is day n + 1), set when the user logged anything that day."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_years')
+    year = models.PositiveSmallIntegerField()
+    bits = models.BinaryField(max_length=46)
+
+    class Meta:
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f"{self.user_id} activity in {self.year}"
 
 
 class Follow(models.Model):
@@ -98,8 +129,13 @@ class Gym(models.Model):
     address = models.CharField(max_length=300)
     latitude = models.FloatField(default=0)
     longitude = models.FloatField(default=0)
+    # Grid cell of (latitude, longitude), kept in step by save(); see core.geo
+    cell_lat = models.IntegerField(default=0, editable=False)
+    cell_lng = models.IntegerField(default=0, editable=False)
     max_capacity = models.IntegerField(default=100)
     current_activity = models.IntegerField(default=0)
+    # Active memberships; maintained by core.gyms, rebuilt by rebuild_member_counts
+    member_count = models.PositiveIntegerField(default=0)
 
     BUSY_CHOICES = [
         ('low', 'Not Crowded'),
@@ -119,17 +155,24 @@ class Gym(models.Model):
 
     class Meta:
         verbose_name_plural = "gyms"
+        indexes = [models.Index(fields=['cell_lat', 'cell_lng'], name='gym_cell_idx')]
 
     def __str__(self):
         return self.name
 
-    @property
-    def distance(self):
-        return "0.3 mi"
+    def save(self, *args, **kwargs):
+        from .geo import cell_for
+        self.cell_lat, self.cell_lng = cell_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'cell_lat', 'cell_lng'}
+        super().save(*args, **kwargs)
 
     @property
-    def member_count(self):
-        return self.memberships.count()
+    def distance(self):
+        """Distance from the searcher, when the gym came from core.geo.nearest()."""
+        miles = getattr(self, 'distance_miles', None)
+        return f"{miles:.1f} mi" if miles is not None else ""
 
 
 class GymMembership(models.Model):
@@ -164,6 +207,41 @@ class GymTopLifter(models.Model):
         return f"{self.user.username} at {self.gym.name}"
 
 
+class CrowdReport(models.Model):
+    """One member's crowd report. Append-only; rolled into CrowdHourly by core.crowd.downsample()."""
+    AREA_CHOICES = [
+        ('arms', 'Arms'),
+        ('legs', 'Legs'),
+        ('cardio', 'Cardio'),
+        ('classes', 'Classes'),
+        ('other', 'Other'),
+    ]
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, related_name='crowd_reports')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    level = models.PositiveSmallIntegerField()  # 1 (empty) to 5 (at capacity)
+    area = models.CharField(max_length=10, choices=AREA_CHOICES, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['gym', 'created_at'], name='crowd_gym_time_idx')]
+
+    def __str__(self):
+        return f"{self.gym_id}: {self.level} at {self.created_at}"
+
+
+class CrowdHourly(models.Model):
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, related_name='crowd_hours')
+    hour = models.DateTimeField()
+    reports = models.PositiveIntegerField(default=0)
+    level_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('gym', 'hour')
+
+    def __str__(self):
+        return f"{self.gym_id} @ {self.hour}: {self.reports} reports"
+
+
 POST_TYPE_CHOICES = [
     ('workout', 'Workout'),
     ('pr', 'Personal Record'),
@@ -200,35 +278,26 @@ class Post(models.Model):
     # Hashtags
     hashtags = models.CharField(max_length=500, blank=True)
 
+    # Denormalized counters, maintained by react_to_post / add_comment
+    heart_count = models.PositiveIntegerField(default=0)
+    thumbsup_count = models.PositiveIntegerField(default=0)
+    flex_count = models.PositiveIntegerField(default=0)
+    fire_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_feed_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_feed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.post_type} ({self.created_at})"
 
-    @property
-    def heart_count(self):
-        return self.reactions.filter(reaction_type='heart').count()
-
-    @property
-    def thumbsup_count(self):
-        return self.reactions.filter(reaction_type='thumbsup').count()
-
-    @property
-    def flex_count(self):
-        return self.reactions.filter(reaction_type='flex').count()
-
-    @property
-    def fire_count(self):
-        return self.reactions.filter(reaction_type='fire').count()
-
-    @property
-    def comment_count(self):
-        return self.comments.count()
-
     @property
     def time_ago(self):
         diff = timezone.now() - self.created_at
@@ -282,6 +351,10 @@ class Reaction(models.Model):
     def __str__(self):
         return f"{self.user.username} {self.reaction_type} on {self.post.id}"
 
+    @staticmethod
+    def counter_field(reaction_type):
+        return f"{reaction_type}_count"
+
 
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
@@ -306,6 +379,24 @@ class PollVote(models.Model):
         unique_together = ('user', 'post')
 
 
+class TimelineEntry(models.Model):
+    """A post materialized into one reader's friends timeline."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(help_text="Copy of the post's created_at")
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in {self.owner.username}'s timeline"
+
+
 class ExerciseDefinition(models.Model):
     CATEGORY_CHOICES = [
         ('chest', 'Chest'),
@@ -367,6 +458,7 @@ class TemplateExercise(models.Model):
 
 class Workout(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workouts')
+    client_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     name = models.CharField(max_length=100, default='Workout')
     template = models.ForeignKey(WorkoutTemplate, on_delete=models.SET_NULL, null=True, blank=True)
     started_at = models.DateTimeField(default=timezone.now)
@@ -405,6 +497,7 @@ class Workout(models.Model):
 
 class WorkoutExercise(models.Model):
     workout = models.ForeignKey(Workout, on_delete=models.CASCADE, related_name='workout_exercises')
+    client_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     exercise = models.ForeignKey(ExerciseDefinition, on_delete=models.CASCADE)
     order = models.IntegerField(default=0)
 
@@ -417,6 +510,7 @@ class WorkoutExercise(models.Model):
 
 class WorkoutSet(models.Model):
     workout_exercise = models.ForeignKey(WorkoutExercise, on_delete=models.CASCADE, related_name='sets')
+    client_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     set_number = models.IntegerField(default=1)
     reps = models.IntegerField(null=True, blank=True)
     weight = models.FloatField(null=True, blank=True)
@@ -431,6 +525,28 @@ class WorkoutSet(models.Model):
         return f"Set {self.set_number}: {self.reps}x{self.weight}lbs"
 
 
+class SyncChange(models.Model):
+    """Latest version of one synced workout object; compacted to a row per object."""
+    KIND_CHOICES = [
+        ('workout', 'Workout'),
+        ('exercise', 'Workout Exercise'),
+        ('set', 'Workout Set'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_changes')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    client_id = models.UUIDField(unique=True)
+    version = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'version'], name='sync_user_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.client_id} v{self.version}"
+
+
 class PersonalRecord(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='personal_records')
     exercise = models.ForeignKey(ExerciseDefinition, on_delete=models.CASCADE)
@@ -454,15 +570,13 @@ class Group(models.Model):
     members = models.ManyToManyField(User, through='GroupMembership', related_name='group_set')
     join_code = models.CharField(max_length=20, unique=True, blank=True)
     avatar_emoji = models.CharField(max_length=10, default='👥')
+    # Maintained by core.groups, rebuilt by rebuild_member_counts
+    member_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
 
-    @property
-    def member_count(self):
-        return self.group_members.count()
-
     def save(self, *args, **kwargs):
         if not self.join_code:
             import random
@@ -496,12 +610,31 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['group', '-created_at', '-id'], name='message_group_idx'),
+            models.Index(fields=['sender', 'recipient', '-created_at', '-id'], name='message_dm_idx'),
+        ]
 
     def __str__(self):
         target = self.group.name if self.group else self.recipient.username
         return f"{self.sender.username} -> {target}: {self.content[:50]}"
 
 
+class ChatReadState(models.Model):
+    """How far one user has read a conversation, and how many messages are unread since."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_read_states')
+    conversation = models.CharField(max_length=30, help_text='"group:<group id>" or "dm:<other user id>"')
+    last_read_id = models.PositiveBigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'conversation')
+
+    def __str__(self):
+        return f"{self.user.username} {self.conversation}: {self.unread_count} unread"
+
+
 class WorkoutInvite(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -513,7 +646,10 @@ class WorkoutInvite(models.Model):
         ('friend', 'Friend Invite'),
     ]
     from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invites_sent')
-    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invites_received')
+    to_user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='invites_received',
+        help_text='Empty for a gym-wide broadcast; responses are then kept in InviteResponse',
+    )
     invite_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='friend')
     gym = models.ForeignKey(Gym, on_delete=models.SET_NULL, null=True, blank=True)
     workout_type = models.CharField(max_length=100, blank=True)
@@ -525,9 +661,31 @@ class WorkoutInvite(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['gym', 'status', '-created_at'], name='invite_gym_status_idx'),
+        ]
+
+    def __str__(self):
+        target = self.to_user.username if self.to_user_id else f"{self.gym} (broadcast)"
+        return f"{self.from_user.username} invited {target} ({self.status})"
+
+    @property
+    def is_broadcast(self):
+        return self.to_user_id is None
+
+
+class InviteResponse(models.Model):
+    """One recipient's answer to a broadcast WorkoutInvite."""
+    invite = models.ForeignKey(WorkoutInvite, on_delete=models.CASCADE, related_name='responses')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invite_responses')
+    status = models.CharField(max_length=20, choices=WorkoutInvite.STATUS_CHOICES)
+    responded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('invite', 'user')
 
     def __str__(self):
-        return f"{self.from_user.username} invited {self.to_user.username} ({self.status})"
+        return f"{self.user.username} {self.status} invite {self.invite_id}"
 
 
 class Nudge(models.Model):
@@ -579,3 +737,36 @@ class GroupStreak(models.Model):
 
     def __str__(self):
         return f"{self.group.name} streak: {self.current_streak}"
+
+
+class LeaderboardSnapshot(models.Model):
+    """One user's rank on a gym or friends leaderboard at the start of a period."""
+    SCOPE_CHOICES = [
+        ('gym', 'Gym'),
+        ('friends', 'Friends'),
+    ]
+    PERIOD_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_snapshots')
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    scope_id = models.IntegerField(help_text='Gym ID, or the owning user ID for friends boards')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    metric = models.CharField(max_length=20)
+    rank = models.PositiveIntegerField()
+    value = models.FloatField(default=0)
+    # Shown next to every entry whatever the metric, frozen with the rank
+    streak = models.PositiveIntegerField(default=0)
+    level = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('scope', 'scope_id', 'period', 'metric', 'period_start', 'user')
+        indexes = [
+            models.Index(fields=['scope', 'scope_id', 'period', 'metric', 'period_start', 'rank'],
+                         name='lb_snapshot_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} #{self.rank} {self.scope}:{self.scope_id} {self.metric} ({self.period_start})"
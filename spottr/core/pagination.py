@@ -0,0 +1,57 @@
+"""Keyset (cursor) pagination over (created_at, id).
+
+Each page is a single indexed range scan that starts right after the last
+row of the previous page, so deep pages cost the same as the first one.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        ts, pk = raw.split('|', 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def keyset_page(queryset, cursor=None, size=20, field='created_at', tiebreak='id', descending=True):
+    """Return ``(items, next_cursor)`` for one page of ``queryset``.
+
+    ``next_cursor`` is None once the end of the result set is reached.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{field}', f'-{tiebreak}')
+    else:
+        queryset = queryset.order_by(field, tiebreak)
+
+    if cursor:
+        queryset = queryset.filter(after_cursor(cursor, field, tiebreak, descending))
+
+    items = list(queryset[:size + 1])
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), getattr(last, tiebreak))
+    return items, next_cursor
+
+
+def after_cursor(cursor, field='created_at', tiebreak='id', descending=True):
+    """Q object selecting the rows that come after ``cursor``."""
+    ts, pk = decode_cursor(cursor)
+    op = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{op}': ts}) | Q(**{field: ts, f'{tiebreak}__{op}': pk})
@@ -0,0 +1,102 @@
+"""Pub/sub for pushing new chat messages to connected clients.
+
+Views publish small JSON-able payloads to a channel; the SSE stream view
+subscribes and forwards them. The backend is pluggable through the
+``SPOTTR_REALTIME_BACKEND`` setting (a dotted path to a class with
+``publish`` and ``subscribe``). The default ``LocalBroker`` keeps
+subscribers in process memory: right for a single ASGI worker, development
+and tests. Several workers need a shared backend (e.g. Redis pub/sub)
+behind the same two methods.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'core.realtime.LocalBroker'
+
+_broker = None
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout=None):
+        """Next payload, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def deliver(self, payload):
+        # Publishers run in sync views on other threads
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, payload)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalBroker:
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, payload):
+        """Deliver ``payload`` to every current subscriber; returns how many there were."""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(payload)
+            except RuntimeError:  # its event loop has already shut down
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'SPOTTR_REALTIME_BACKEND', DEFAULT_BACKEND))()
+    return _broker
+
+
+def publish(channel, payload):
+    return get_broker().publish(channel, payload)
+
+
+def subscribe(channel):
+    return get_broker().subscribe(channel)
+
+
+def chat_channel(chat_type, chat_id, user_id):
+    """Channel for a group chat, or for the DM between ``user_id`` and ``chat_id``."""
+    if chat_type == 'group':
+        return f'chat:group:{chat_id}'
+    low, high = sorted((int(chat_id), int(user_id)))
+    return f'chat:dm:{low}:{high}'
@@ -0,0 +1,64 @@
+"""Cached social graph: friend, follower and following ID sets per user.
+
+Each user's three sets are built together in one pass and cached under a
+single key. Views that change a relationship call ``invalidate`` for both
+ends of the edge; the timeout only bounds staleness for edits made outside
+those views (admin, shell).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Follow, Friendship
+
+
+def _key(user_id):
+    return f'social:{user_id}'
+
+
+def graph(user_id):
+    data = cache.get(_key(user_id))
+    if data is None:
+        friends = set()
+        for from_id, to_id in Friendship.objects.filter(
+            Q(from_user_id=user_id) | Q(to_user_id=user_id), accepted=True
+        ).values_list('from_user_id', 'to_user_id'):
+            friends.add(to_id if from_id == user_id else from_id)
+        data = {
+            'friends': frozenset(friends),
+            'followers': frozenset(Follow.objects.filter(following_id=user_id).values_list('follower_id', flat=True)),
+            'following': frozenset(Follow.objects.filter(follower_id=user_id).values_list('following_id', flat=True)),
+        }
+        cache.set(_key(user_id), data, getattr(settings, 'SPOTTR_SOCIAL_CACHE_TIMEOUT', 600))
+    return data
+
+
+def friend_ids(user_id):
+    return graph(user_id)['friends']
+
+
+def follower_ids(user_id):
+    return graph(user_id)['followers']
+
+
+def following_ids(user_id):
+    return graph(user_id)['following']
+
+
+def is_following(user_id, other_id):
+    return other_id in following_ids(user_id)
+
+
+def are_friends(user_id, other_id):
+    return other_id in friend_ids(user_id)
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_key(uid) for uid in user_ids])
+
+
+def accept_friendship(friendship):
+    """Mark a pending friend request accepted and drop both users' cached graphs."""
+    Friendship.objects.filter(id=friendship.id).update(accepted=True)
+    friendship.accepted = True
+    invalidate(friendship.from_user_id, friendship.to_user_id)
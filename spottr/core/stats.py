@@ -0,0 +1,78 @@
+"""Incremental maintenance of the per-user UserStats rollup.
+
+Only completed sets in completed workouts count, matching what the
+profile page has always shown.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Q, Sum
+
+from .models import UserStats, WorkoutSet
+
+
+def _bump(user_id, workouts=0, sets=0, weight=0):
+    UserStats.objects.get_or_create(user_id=user_id)
+    UserStats.objects.filter(user_id=user_id).update(
+        total_workouts=F('total_workouts') + workouts,
+        total_sets=F('total_sets') + sets,
+        total_weight=F('total_weight') + weight,
+    )
+
+
+def workout_completed(workout):
+    """Add a just-completed workout's sets and volume to its owner's totals."""
+    totals = WorkoutSet.objects.filter(
+        workout_exercise__workout=workout, completed=True
+    ).aggregate(sets=Count('id'), weight=Sum('weight'))
+    _bump(workout.user_id, workouts=1, sets=totals['sets'], weight=totals['weight'] or 0)
+
+
+def set_changed(workout, old_completed, old_weight, new_completed, new_weight):
+    """Apply the delta of editing one set; no-op while the workout is in progress."""
+    sets_changed(workout, [(old_completed, old_weight, new_completed, new_weight)])
+
+
+def sets_changed(workout, changes):
+    """Apply many ``(old_completed, old_weight, new_completed, new_weight)`` edits at once."""
+    if not workout.completed:
+        return
+    sets = 0
+    weight = 0
+    for old_completed, old_weight, new_completed, new_weight in changes:
+        sets += int(bool(new_completed)) - int(bool(old_completed))
+        weight += ((new_weight or 0) if new_completed else 0) - ((old_weight or 0) if old_completed else 0)
+    if sets or weight:
+        _bump(workout.user_id, sets=sets, weight=weight)
+
+
+def recompute(user_ids=None):
+    """Rebuild rollups from the workout tables. Returns the number of rows written."""
+    sets = WorkoutSet.objects.filter(completed=True, workout_exercise__workout__completed=True)
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        sets = sets.filter(workout_exercise__workout__user_id__in=user_ids)
+
+    workout_counts = dict(
+        users.annotate(n=Count('workouts', filter=Q(workouts__completed=True))).values_list('id', 'n')
+    )
+    set_totals = {
+        row['workout_exercise__workout__user_id']: row
+        for row in sets.values('workout_exercise__workout__user_id').annotate(
+            n=Count('id'), weight=Sum('weight')
+        ).order_by()
+    }
+
+    rows = []
+    for user_id, n_workouts in workout_counts.items():
+        totals = set_totals.get(user_id, {})
+        rows.append(UserStats(
+            user_id=user_id,
+            total_workouts=n_workouts,
+            total_sets=totals.get('n', 0),
+            total_weight=totals.get('weight') or 0,
+        ))
+    UserStats.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True, unique_fields=['user'],
+        update_fields=['total_workouts', 'total_sets', 'total_weight'],
+    )
+    return len(rows)
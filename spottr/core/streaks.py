@@ -0,0 +1,212 @@
+"""Workout streaks counted in each user's own time zone.
+
+A streak is a run of consecutive local days with a completed workout or a
+post. ``record`` is the O(1) path for activity logged as it happens;
+``recompute`` derives the streaks from the full history, one query per
+time zone in use, and repairs whatever the incremental path got wrong.
+``expire`` zeroes the streaks that lapsed at the user's local midnight with
+one UPDATE per time zone.
+
+Group streaks are computed for every group at once by ``recompute_groups``:
+a group's day counts when at least GROUP_QUORUM of its members were active
+(server dates, since members span time zones).
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import achievements, badges
+from .models import GroupMembership, GroupStreak, Post, Profile, Workout
+
+STREAK_FIELDS = ['current_streak', 'longest_streak', 'last_workout_date']
+GROUP_FIELDS = ['current_streak', 'best_streak', 'active_members']
+GROUP_LOOKBACK_DAYS = 366
+
+
+def zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('UTC')
+
+
+def local_date(profile, when=None):
+    return timezone.localtime(when or timezone.now(), zone(profile.timezone)).date()
+
+
+def record(profile, when=None):
+    """Count activity at ``when`` (default now). Returns the UserAchievements the streak unlocked."""
+    day = local_date(profile, when)
+    last = profile.last_workout_date
+    if last is not None and day <= last:
+        return []  # already counted, or backdated; recompute handles the latter
+    profile.current_streak = profile.current_streak + 1 if last == day - timedelta(days=1) else 1
+    profile.longest_streak = max(profile.longest_streak, profile.current_streak)
+    profile.last_workout_date = day
+    profile.save(update_fields=STREAK_FIELDS)
+    badges.invalidate(profile.user_id)
+    return achievements.emit('streak', profile.user_id)
+
+
+def _streaks(days, today):
+    """``(current, longest, last day)`` for sorted, distinct active days."""
+    longest = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous is not None and day == previous + timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and previous >= today - timedelta(days=1) else 0
+    return current, longest, previous
+
+
+def _active_days(user_ids, tz):
+    """``(user_id, local day)`` pairs for the users, sorted, from one UNION query."""
+    workouts = Workout.objects.filter(user_id__in=user_ids, completed=True).annotate(
+        day=TruncDate('started_at', tzinfo=tz)).values_list('user_id', 'day')
+    posts = Post.objects.filter(user_id__in=user_ids).annotate(
+        day=TruncDate('created_at', tzinfo=tz)).values_list('user_id', 'day')
+    return workouts.order_by().union(posts.order_by()).order_by('user_id', 'day')
+
+
+def recompute(user_ids=None, batch_size=1000):
+    """Rederive streaks from history. Returns the number of profiles corrected."""
+    profiles = Profile.objects.only('id', 'user_id', 'timezone', *STREAK_FIELDS).order_by('user_id')
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+    by_zone = defaultdict(list)
+    for profile in profiles.iterator():
+        by_zone[profile.timezone].append(profile)
+
+    now = timezone.now()
+    fixed = []
+    for name, members in by_zone.items():
+        tz = zone(name)
+        today = timezone.localtime(now, tz).date()
+        for start in range(0, len(members), batch_size):
+            chunk = members[start:start + batch_size]
+            days = defaultdict(list)
+            for user_id, day in _active_days([p.user_id for p in chunk], tz):
+                days[user_id].append(day)
+            for profile in chunk:
+                values = _streaks(days[profile.user_id], today)
+                if values != tuple(getattr(profile, f) for f in STREAK_FIELDS):
+                    profile.current_streak, profile.longest_streak, profile.last_workout_date = values
+                    fixed.append(profile)
+    Profile.objects.bulk_update(fixed, STREAK_FIELDS, batch_size=batch_size)
+    fixed_ids = [p.user_id for p in fixed]
+    badges.invalidate(*fixed_ids)
+    for start in range(0, len(fixed_ids), batch_size):
+        achievements.emit('streak', *fixed_ids[start:start + batch_size])
+    return len(fixed)
+
+
+def expire():
+    """Zero streaks with no activity since before yesterday, local time. Returns how many lapsed."""
+    now = timezone.now()
+    expired = []
+    zones = Profile.objects.filter(current_streak__gt=0).values_list('timezone', flat=True).distinct()
+    for name in list(zones):
+        yesterday = timezone.localtime(now, zone(name)).date() - timedelta(days=1)
+        lapsed = Profile.objects.filter(timezone=name, current_streak__gt=0).filter(
+            Q(last_workout_date__lt=yesterday) | Q(last_workout_date__isnull=True))
+        user_ids = list(lapsed.values_list('user_id', flat=True))
+        if user_ids:
+            Profile.objects.filter(user_id__in=user_ids).update(current_streak=0)
+            expired.extend(user_ids)
+    badges.invalidate(*expired)
+    return len(expired)
+
+
+def _activity_masks(start, today):
+    """``{user_id: int}`` with bit ``n`` set when the user was active on ``start + n days``."""
+    workouts = Workout.objects.filter(completed=True, started_at__date__gte=start).annotate(
+        day=TruncDate('started_at')).values_list('user_id', 'day')
+    posts = Post.objects.filter(created_at__date__gte=start).annotate(
+        day=TruncDate('created_at')).values_list('user_id', 'day')
+    masks = defaultdict(int)
+    for user_id, day in workouts.order_by().union(posts.order_by()):
+        if day <= today:
+            masks[user_id] |= 1 << (day - start).days
+    return masks
+
+
+def _group_streak(member_masks, days, quorum):
+    """``(current, best, active members)`` from the members' activity masks."""
+    counts = [0] * days
+    for mask in member_masks:
+        while mask:
+            low = mask & -mask
+            counts[low.bit_length() - 1] += 1
+            mask ^= low
+    needed = max(1, math.ceil(len(member_masks) * quorum))
+    qualified = [n >= needed for n in counts]
+
+    best = run = 0
+    for ok in qualified:
+        run = run + 1 if ok else 0
+        best = max(best, run)
+    # Today still counts as pending: a streak through yesterday is not broken yet
+    last = days - 1 if qualified[-1] else days - 2
+    current = 0
+    while last >= 0 and qualified[last]:
+        current += 1
+        last -= 1
+    recent = (1 << (days - 1)) | (1 << (days - 2))
+    active = sum(1 for mask in member_masks if mask & recent)
+    return current, best, active
+
+
+def recompute_groups(batch_size=1000):
+    """Recompute GroupStreak for every group in one pass over memberships. Returns rows written."""
+    today = timezone.localdate()
+    days = GROUP_LOOKBACK_DAYS
+    start = today - timedelta(days=days - 1)
+    quorum = getattr(settings, 'SPOTTR_GROUP_STREAK_QUORUM', 0.5)
+    masks = _activity_masks(start, today)
+
+    existing = {}
+    for row in GroupStreak.objects.order_by('-id'):
+        existing[row.group_id] = row  # lowest id wins if a group has duplicates
+    new, changed = [], []
+    seen = set()
+
+    def flush(group_id, member_masks):
+        seen.add(group_id)
+        current, best, active = _group_streak(member_masks, days, quorum)
+        row = existing.get(group_id)
+        if row is None:
+            new.append(GroupStreak(group_id=group_id, current_streak=current, best_streak=best,
+                                   active_members=active))
+            return
+        values = (current, max(best, row.best_streak), active)
+        if values != tuple(getattr(row, f) for f in GROUP_FIELDS):
+            row.current_streak, row.best_streak, row.active_members = values
+            changed.append(row)
+
+    group_id, member_masks = None, []
+    memberships = GroupMembership.objects.order_by('group_id').values_list('group_id', 'user_id')
+    for gid, user_id in memberships.iterator(chunk_size=batch_size * 10):
+        if gid != group_id:
+            if group_id is not None:
+                flush(group_id, member_masks)
+            group_id, member_masks = gid, []
+        member_masks.append(masks.get(user_id, 0))
+    if group_id is not None:
+        flush(group_id, member_masks)
+    for row in existing.values():
+        if row.group_id not in seen and (row.current_streak or row.active_members):
+            row.current_streak = row.active_members = 0  # the group has no members left
+            changed.append(row)
+
+    with transaction.atomic():
+        GroupStreak.objects.bulk_create(new, batch_size=batch_size)
+        GroupStreak.objects.bulk_update(changed, GROUP_FIELDS, batch_size=batch_size)
+    return len(new) + len(changed)
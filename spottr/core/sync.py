@@ -0,0 +1,340 @@
+"""Offline-first sync for workouts, their exercises and sets.
+
+Objects are addressed by client-generated UUIDs (``client_id``), so a
+device can create rows without a round-trip. Every change is stamped with
+the next per-user version from ``Profile.sync_version`` and recorded in
+SyncChange, which keeps only the latest version of each object; "what
+changed since N" is a single indexed range scan.
+
+Pushes are idempotent: replaying a batch writes the same values to the
+same IDs and changes nothing. Conflicts are resolved per object: when the
+server copy has moved past the client's ``base_version`` and the pushed
+values differ, the server wins and the change is reported back so the
+client can adopt the server copy. Deletes always win. A malformed object
+is rejected the same way, with an ``error``, and the rest of the batch
+still applies.
+
+Finishing a workout still goes through ``complete_workout`` because it
+updates stats and streaks; ``completed`` is read-only here for workouts.
+"""
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from . import achievements, activity, stats, streaks, workouts
+from .models import ExerciseDefinition, Profile, SyncChange, Workout, WorkoutExercise, WorkoutSet
+
+KINDS = ['workout', 'exercise', 'set']  # parents before children
+MODEL_KINDS = {Workout: 'workout', WorkoutExercise: 'exercise', WorkoutSet: 'set'}
+PARENT_FIELD = {'exercise': 'workout', 'set': 'exercise'}
+PULL_LIMIT = 500
+
+# Accepted JSON types of each pushed field; values are cast after this check
+_NUMBER = (int, float, str, type(None))
+FIELD_TYPES = {
+    'workout': {'name': (str, type(None)), 'notes': (str, type(None)), 'started_at': str},
+    'exercise': {'workout': str, 'definition': int, 'order': (int, str, type(None))},
+    'set': {
+        'exercise': str, 'set_number': _NUMBER, 'reps': _NUMBER, 'weight': _NUMBER,
+        'distance': _NUMBER, 'time_seconds': _NUMBER, 'completed': (bool, int, str),
+    },
+}
+
+
+class SyncError(ValueError):
+    pass
+
+
+def current_version(user_id):
+    return Profile.objects.filter(user_id=user_id).values_list('sync_version', flat=True).first() or 0
+
+
+def _allocate(user_id, n):
+    """Reserve ``n`` versions for ``user_id`` and return the last one."""
+    if not Profile.objects.filter(user_id=user_id).update(sync_version=F('sync_version') + n):
+        Profile.objects.create(user_id=user_id, sync_version=n)
+    return current_version(user_id)
+
+
+@transaction.atomic
+def touch(user_id, objects=(), deleted=()):
+    """Stamp changed ``objects`` and deleted ``(kind, client_id)`` pairs with new versions.
+
+    Returns the user's latest version.
+    """
+    entries = {obj.client_id: (MODEL_KINDS[type(obj)], False) for obj in objects}
+    entries.update((client_id, (kind, True)) for kind, client_id in deleted)
+    if not entries:
+        return current_version(user_id)
+    last = _allocate(user_id, len(entries))
+    first = last - len(entries) + 1
+    SyncChange.objects.bulk_create([
+        SyncChange(user_id=user_id, kind=kind, client_id=client_id, deleted=gone, version=first + i)
+        for i, (client_id, (kind, gone)) in enumerate(entries.items())
+    ], update_conflicts=True, unique_fields=['client_id'], update_fields=['version', 'deleted'])
+    return last
+
+
+def _owned(user, kind, client_ids):
+    if not client_ids:
+        return {}
+    if kind == 'workout':
+        queryset = Workout.objects.filter(user=user)
+    elif kind == 'exercise':
+        queryset = WorkoutExercise.objects.filter(workout__user=user).select_related('workout')
+    else:
+        queryset = WorkoutSet.objects.filter(
+            workout_exercise__workout__user=user
+        ).select_related('workout_exercise__workout')
+    return {obj.client_id: obj for obj in queryset.filter(client_id__in=client_ids)}
+
+
+def _serialize(kind, obj):
+    if kind == 'workout':
+        return {
+            'name': obj.name,
+            'notes': obj.notes,
+            'started_at': obj.started_at.isoformat(),
+            'completed': obj.completed,
+        }
+    if kind == 'exercise':
+        return {'workout': str(obj.workout.client_id), 'definition': obj.exercise_id, 'order': obj.order}
+    return {
+        'exercise': str(obj.workout_exercise.client_id),
+        'set_number': obj.set_number,
+        'reps': obj.reps,
+        'weight': obj.weight,
+        'distance': obj.distance,
+        'time_seconds': obj.time_seconds,
+        'completed': obj.completed,
+    }
+
+
+def pull(user, since=0, limit=PULL_LIMIT):
+    """Objects changed after version ``since``, parents first.
+
+    Returns ``(changes, version, has_more)``; pass ``version`` back as the
+    next ``since``.
+    """
+    rows = list(SyncChange.objects.filter(user=user, version__gt=since).order_by('version')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = []
+    for kind in KINDS:
+        kind_rows = [row for row in rows if row.kind == kind]
+        live = _owned(user, kind, [row.client_id for row in kind_rows if not row.deleted])
+        for row in kind_rows:
+            change = {'kind': kind, 'id': str(row.client_id), 'version': row.version}
+            obj = live.get(row.client_id)
+            if obj is None:  # deleted, or removed along with its parent
+                change['deleted'] = True
+            else:
+                change['fields'] = _serialize(kind, obj)
+            changes.append(change)
+    return changes, rows[-1].version if rows else since, has_more
+
+
+def _uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise SyncError(f'Invalid id {value!r}')
+
+
+def _int(data, name):
+    try:
+        return int(data.get(name) or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise SyncError(f'Invalid {name}: {data[name]!r}')
+
+
+def _clean(kind, data):
+    """Validate the editable fields of one pushed object (parents excluded)."""
+    if not isinstance(data, dict):
+        raise SyncError('fields must be an object')
+    for name, types in FIELD_TYPES[kind].items():
+        if name in data and not isinstance(data[name], types):
+            raise SyncError(f'Invalid {name}: {data[name]!r}')
+    fields = {}
+    if kind == 'workout':
+        for name in ('name', 'notes'):
+            if name in data:
+                fields[name] = str(data[name] or '')[:100 if name == 'name' else None]
+        if 'started_at' in data:
+            started_at = parse_datetime(str(data['started_at']))
+            if started_at is None:
+                raise SyncError(f'Invalid started_at: {data["started_at"]!r}')
+            fields['started_at'] = started_at
+    elif kind == 'exercise':
+        if 'order' in data:
+            fields['order'] = _int(data, 'order')
+    else:
+        fields = workouts.clean_set_fields(data)
+        if 'set_number' in data:
+            fields['set_number'] = _int(data, 'set_number')
+    return fields
+
+
+def _set_state(ws):
+    return ws.completed, ws.weight
+
+
+def _conflict(kind, client_id, obj=None, version=None, error=None):
+    """A rejected change, carrying the server's copy of the object (or ``deleted``)."""
+    if obj is None:
+        conflict = {'kind': kind, 'id': str(client_id), 'deleted': True}
+    else:
+        conflict = {'kind': kind, 'id': str(client_id), 'version': version, 'fields': _serialize(kind, obj)}
+    if error:
+        conflict['error'] = error
+    return conflict
+
+
+@transaction.atomic
+def push(user, changes):
+    """Apply a client's queued changes in one transaction.
+
+    Each change is ``{"kind", "id", "op": "upsert"|"delete", "base_version",
+    "fields"}``. New exercises and sets name their parent's ``client_id`` in
+    ``fields`` (``workout`` / ``exercise``); new exercises also carry the
+    ExerciseDefinition ID as ``definition``. Returns the list of rejected
+    changes, each with the server's copy (or ``deleted``) and, for malformed
+    ones, an ``error``.
+    """
+    if not isinstance(changes, list):
+        raise SyncError('Expected a list of changes')
+    by_kind = {kind: [] for kind in KINDS}
+    for change in changes:
+        if not isinstance(change, dict) or change.get('kind') not in KINDS:
+            raise SyncError('Each change needs a kind of workout, exercise or set')
+        if change.get('op', 'upsert') not in ('upsert', 'delete'):
+            raise SyncError(f'Unknown op {change.get("op")!r}')
+        change['id'] = _uuid(change.get('id'))
+        by_kind[change['kind']].append(change)
+
+    # Load every object the batch names, including parents, up front
+    wanted = {kind: {c['id'] for c in by_kind[kind]} for kind in KINDS}
+    for kind, parent in PARENT_FIELD.items():
+        for change in by_kind[kind]:
+            fields = change.get('fields')
+            if isinstance(fields, dict) and fields.get(parent) is not None:
+                try:
+                    wanted[parent].add(_uuid(fields[parent]))
+                except SyncError:
+                    pass  # rejected with the change below
+    loaded = {kind: _owned(user, kind, wanted[kind]) for kind in KINDS}
+    versions = dict(SyncChange.objects.filter(
+        user=user, client_id__in=[c['id'] for c in changes]
+    ).values_list('client_id', 'version'))
+    definitions = set(ExerciseDefinition.objects.filter(id__in=[
+        c['fields'].get('definition') for c in by_kind['exercise']
+        if isinstance(c.get('fields'), dict) and isinstance(c['fields'].get('definition'), int)
+    ]).values_list('id', flat=True))
+
+    touched = []
+    deleted = []
+    conflicts = []
+    set_deltas = {}
+    recompute_stats = False
+    rebuild_activity = False
+
+    for kind in KINDS:
+        model = Workout if kind == 'workout' else WorkoutExercise if kind == 'exercise' else WorkoutSet
+        objects = loaded[kind]
+        to_create = []
+        to_update = {}
+        update_fields = set()
+        to_delete = {}
+        for change in by_kind[kind]:
+            client_id = change['id']
+            obj = objects.get(client_id)
+
+            if change.get('op') == 'delete':
+                if obj is not None:
+                    to_delete[client_id] = objects.pop(client_id)
+                    to_update.pop(client_id, None)
+                elif client_id not in versions:
+                    continue
+                deleted.append((kind, client_id))
+                continue
+
+            data = change.get('fields') or {}
+            try:
+                fields = _clean(kind, data)
+                parent_field = PARENT_FIELD.get(kind)
+                parent_id = _uuid(data.get(parent_field)) if obj is None and parent_field else None
+                base_version = _int(change, 'base_version')
+            except ValueError as e:  # a SyncError or SetChangeError
+                conflicts.append(_conflict(kind, client_id, obj, versions.get(client_id), error=str(e)))
+                continue
+            if obj is None:
+                if client_id in versions:  # deleted on the server
+                    conflicts.append(_conflict(kind, client_id))
+                    continue
+                if parent_field:
+                    parent = loaded[parent_field].get(parent_id)
+                    if parent is None:  # parent gone; the client should drop this too
+                        conflicts.append(_conflict(kind, client_id))
+                        continue
+                if kind == 'workout':
+                    obj = Workout(user=user, client_id=client_id, **fields)
+                elif kind == 'exercise':
+                    definition = data.get('definition')
+                    if definition not in definitions:
+                        conflicts.append(_conflict(
+                            kind, client_id, error=f'Unknown exercise definition {definition!r}'
+                        ))
+                        continue
+                    obj = WorkoutExercise(workout=parent, exercise_id=definition, client_id=client_id, **fields)
+                else:
+                    obj = WorkoutSet(workout_exercise=parent, client_id=client_id, **fields)
+                    set_deltas.setdefault(parent.workout, []).append((False, None, *_set_state(obj)))
+                to_create.append(obj)
+                objects[client_id] = obj
+                continue
+
+            changed = {name: value for name, value in fields.items() if getattr(obj, name) != value}
+            if not changed:
+                continue
+            if versions.get(client_id, 0) > base_version:
+                conflicts.append(_conflict(kind, client_id, obj, versions[client_id]))
+                continue
+            old_state = _set_state(obj) if kind == 'set' else None
+            for name, value in changed.items():
+                setattr(obj, name, value)
+            if kind == 'set':
+                set_deltas.setdefault(obj.workout_exercise.workout, []).append((*old_state, *_set_state(obj)))
+            to_update[client_id] = obj
+            update_fields.update(changed)
+
+        for obj in to_delete.values():
+            if kind == 'set':
+                set_deltas.setdefault(obj.workout_exercise.workout, []).append((*_set_state(obj), False, None))
+            else:
+                workout = obj if kind == 'workout' else obj.workout
+                recompute_stats = recompute_stats or workout.completed
+                rebuild_activity = rebuild_activity or (kind == 'workout' and workout.completed)
+        if to_delete:
+            model.objects.filter(id__in=[obj.id for obj in to_delete.values()]).delete()
+        try:
+            model.objects.bulk_create(to_create)
+        except IntegrityError:
+            raise SyncError('An object with that id already exists')
+        if to_update:
+            model.objects.bulk_update(to_update.values(), list(update_fields))
+        touched.extend(to_create)
+        touched.extend(to_update.values())
+
+    if recompute_stats:
+        stats.recompute([user.id])
+        achievements.emit('workout', user.id)
+    else:
+        for workout, deltas in set_deltas.items():
+            stats.sets_changed(workout, deltas)
+    if rebuild_activity:
+        activity.rebuild(user.id, streaks.zone(user.profile.timezone))
+    touch(user.id, touched, deleted)
+    return conflicts
@@ -0,0 +1,110 @@
+"""Materialized friends timeline (fan-out on write).
+
+When someone posts, a TimelineEntry is written for every follower and
+accepted friend, so reading the friends tab is one range scan over
+(owner, created_at, post). Authors whose audience is larger than
+SPOTTR_TIMELINE_FANOUT_LIMIT are flagged ``fanout_on_read`` instead and
+their posts are merged in at read time. When such an author's audience
+shrinks back under the limit, their recent posts are written out to it
+before fan-out resumes, since those were never materialized.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from . import social
+from .models import Post, Profile, TimelineEntry
+from .pagination import keyset_page, after_cursor, encode_cursor
+
+PULL_AUTHORS_CACHE_KEY = 'timeline:pull_authors'
+BACKFILL_POSTS = 50
+
+
+def fanout_limit():
+    return getattr(settings, 'SPOTTR_TIMELINE_FANOUT_LIMIT', 5000)
+
+
+def audience_ids(author_id):
+    """Users whose friends tab shows posts by ``author_id``."""
+    return (social.follower_ids(author_id) | social.friend_ids(author_id)) - {author_id}
+
+
+def fan_out(post):
+    """Write ``post`` into its audience's timelines. Returns rows written."""
+    audience = audience_ids(post.user_id)
+    if len(audience) > fanout_limit():
+        if Profile.objects.filter(user_id=post.user_id, fanout_on_read=False).update(fanout_on_read=True):
+            cache.delete(PULL_AUTHORS_CACHE_KEY)
+        return 0
+
+    if Profile.objects.filter(user_id=post.user_id, fanout_on_read=True).update(fanout_on_read=False):
+        cache.delete(PULL_AUTHORS_CACHE_KEY)
+        _backfill(post.user_id, audience)
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(owner_id=uid, post_id=post.id, author_id=post.user_id, created_at=post.created_at)
+        for uid in audience
+    ], batch_size=1000, ignore_conflicts=True)
+    return len(audience)
+
+
+def _backfill(author_id, owner_ids, limit=BACKFILL_POSTS):
+    """Write ``author_id``'s recent posts into the timelines of ``owner_ids``."""
+    recent = list(
+        Post.objects.filter(user_id=author_id).order_by('-created_at', '-id').values_list('id', 'created_at')[:limit]
+    )
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(owner_id=uid, post_id=pid, author_id=author_id, created_at=created_at)
+        for uid in owner_ids
+        for pid, created_at in recent
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+def add_source(owner_id, author_id, limit=BACKFILL_POSTS):
+    """Backfill ``author_id``'s recent posts after ``owner_id`` starts following them."""
+    if author_id in pull_authors():
+        return
+    _backfill(author_id, [owner_id], limit)
+
+
+def remove_source(owner_id, author_id):
+    """Drop ``author_id``'s posts unless ``owner_id`` is still connected to them."""
+    if not (social.is_following(owner_id, author_id) or social.are_friends(owner_id, author_id)):
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+
+def pull_authors():
+    ids = cache.get(PULL_AUTHORS_CACHE_KEY)
+    if ids is None:
+        ids = set(Profile.objects.filter(fanout_on_read=True).values_list('user_id', flat=True))
+        cache.set(PULL_AUTHORS_CACHE_KEY, ids, 300)
+    return ids
+
+
+def read_timeline(user, cursor=None, size=20):
+    """Return ``(post_ids, next_cursor)`` for one page of ``user``'s friends timeline."""
+    entries, next_cursor = keyset_page(
+        TimelineEntry.objects.filter(owner=user).only('post_id', 'created_at'),
+        cursor=cursor, size=size, tiebreak='post_id',
+    )
+    page = [(e.created_at, e.post_id) for e in entries]
+
+    pulled = _followed_pull_authors(user)
+    if pulled:
+        posts = Post.objects.filter(user_id__in=pulled).order_by('-created_at', '-id')
+        if cursor:
+            posts = posts.filter(after_cursor(cursor))
+        page.extend(posts.values_list('created_at', 'id')[:size + 1])
+        page = sorted(set(page), reverse=True)
+        if len(page) > size:
+            page = page[:size]
+            next_cursor = encode_cursor(*page[-1])
+        elif next_cursor:
+            next_cursor = encode_cursor(*page[-1])
+
+    return [pid for _, pid in page], next_cursor
+
+
+def _followed_pull_authors(user):
+    candidates = pull_authors()
+    if not candidates:
+        return set()
+    return candidates & (social.following_ids(user.id) | social.friend_ids(user.id))
@@ -0,0 +1,126 @@
+"""Per-user read cursors and unread counters for group chats and DMs.
+
+Each (user, conversation) pair has one ChatReadState row. Sending a message
+bumps the readers' counters in one UPDATE; opening a chat is a single-row
+upsert that moves the cursor and zeroes the counter. Badges are read
+straight from the counters, never from the message table.
+"""
+from django.db.models import F, Max, Q, Sum
+
+from . import badges
+from .models import ChatReadState, GroupMembership, Message
+
+
+def conversation_key(chat_type, chat_id):
+    """Key for the group chat, or for the DM with user ``chat_id`` (from the reader's side)."""
+    return f'{"group" if chat_type == "group" else "dm"}:{chat_id}'
+
+
+def mark_read(user_id, key, message_id):
+    ChatReadState.objects.bulk_create(
+        [ChatReadState(user_id=user_id, conversation=key, last_read_id=message_id, unread_count=0)],
+        update_conflicts=True, unique_fields=['user', 'conversation'],
+        update_fields=['last_read_id', 'unread_count', 'updated_at'],
+    )
+    badges.invalidate(user_id)
+
+
+def message_sent(msg):
+    """Count ``msg`` as unread for everyone in its conversation except the sender."""
+    if msg.group_id:
+        key = conversation_key('group', msg.group_id)
+        own_key = key
+        readers = set(
+            GroupMembership.objects.filter(group_id=msg.group_id).values_list('user_id', flat=True)
+        ) - {msg.sender_id}
+    else:
+        key = conversation_key('dm', msg.sender_id)
+        own_key = conversation_key('dm', msg.recipient_id)
+        readers = {msg.recipient_id}
+
+    states = ChatReadState.objects.filter(conversation=key, user_id__in=readers)
+    if readers and states.update(unread_count=F('unread_count') + 1) < len(readers):
+        existing = set(states.values_list('user_id', flat=True))
+        ChatReadState.objects.bulk_create([
+            ChatReadState(user_id=user_id, conversation=key, unread_count=1)
+            for user_id in readers - existing
+        ], ignore_conflicts=True)
+    badges.invalidate(*readers)
+    mark_read(msg.sender_id, own_key, msg.id)
+
+
+def counts(user_id):
+    """``{conversation key: unread count}`` for every conversation with unread messages."""
+    return dict(ChatReadState.objects.filter(
+        user_id=user_id, unread_count__gt=0
+    ).values_list('conversation', 'unread_count'))
+
+
+def total(user_id):
+    return ChatReadState.objects.filter(user_id=user_id).aggregate(n=Sum('unread_count'))['n'] or 0
+
+
+def _missing_states(user_ids):
+    """Read states for conversations that have none yet (messages from before
+    the counters existed, or seeded data), with the cursor at the last
+    message the user sent or that was flagged ``read``."""
+    members = GroupMembership.objects.all()
+    messages = Message.objects.order_by()
+    if user_ids is not None:
+        members = members.filter(user_id__in=user_ids)
+        messages = messages.filter(
+            Q(sender_id__in=user_ids) | Q(recipient_id__in=user_ids)
+            | Q(group_id__in=members.values('group_id'))
+        )
+
+    cursors = {}
+    group_read = {}
+    rows = messages.values_list('group_id', 'sender_id', 'recipient_id').annotate(
+        last=Max('id'), last_read=Max('id', filter=Q(read=True)),
+    )
+    for group_id, sender_id, recipient_id, last, last_read in rows:
+        if group_id:
+            group_read[group_id] = max(group_read.get(group_id, 0), last_read or 0)
+            own = (sender_id, conversation_key('group', group_id))
+        else:
+            own = (sender_id, conversation_key('dm', recipient_id))
+            theirs = (recipient_id, conversation_key('dm', sender_id))
+            cursors[theirs] = max(cursors.get(theirs, 0), last_read or 0)
+        cursors[own] = max(cursors.get(own, 0), last)
+    for user_id, group_id in members.values_list('user_id', 'group_id'):
+        key = (user_id, conversation_key('group', group_id))
+        cursors[key] = max(cursors.get(key, 0), group_read.get(group_id, 0))
+
+    if user_ids is not None:
+        cursors = {key: cursor for key, cursor in cursors.items() if key[0] in user_ids}
+    existing = ChatReadState.objects.filter(user_id__in={user_id for user_id, _ in cursors})
+    for key in existing.values_list('user_id', 'conversation'):
+        cursors.pop(key, None)
+    return [
+        ChatReadState(user_id=user_id, conversation=conversation, last_read_id=cursor)
+        for (user_id, conversation), cursor in cursors.items()
+    ]
+
+
+def recompute(user_ids=None):
+    """Create missing read states, then recount every counter from its read
+    cursor. Returns the number of rows created or fixed."""
+    created = ChatReadState.objects.bulk_create(_missing_states(user_ids), ignore_conflicts=True, batch_size=1000)
+    states = ChatReadState.objects.all()
+    if user_ids is not None:
+        states = states.filter(user_id__in=user_ids)
+    fixed = []
+    for state in states.iterator():
+        kind, chat_id = state.conversation.split(':', 1)
+        if kind == 'group':
+            messages = Message.objects.filter(group_id=chat_id)
+        else:
+            messages = Message.objects.filter(sender_id=chat_id, recipient_id=state.user_id, group__isnull=True)
+        n = messages.filter(~Q(sender_id=state.user_id), id__gt=state.last_read_id).count()
+        if n != state.unread_count:
+            state.unread_count = n
+            fixed.append(state)
+    ChatReadState.objects.bulk_update(fixed, ['unread_count'], batch_size=1000)
+    new = {(state.user_id, state.conversation) for state in created}
+    badges.invalidate(*{state.user_id for state in [*created, *fixed]})
+    return len(new) + sum((state.user_id, state.conversation) not in new for state in fixed)
@@ -10,6 +10,7 @@ urlpatterns = [
 
     # Feed (default)
     path('', views.feed_view, name='feed'),
+    path('feed/page/', views.feed_page, name='feed_page'),
     path('post/checkin/', views.create_checkin, name='create_checkin'),
     path('post/create/', views.create_post, name='create_post'),
     path('post/<int:post_id>/react/', views.react_to_post, name='react_to_post'),
@@ -18,14 +19,18 @@ urlpatterns = [
 
     # Profile
     path('profile/', views.profile_view, name='my_profile'),
-    path('profile/<str:username>/', views.profile_view, name='user_profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('profile/<str:username>/', views.profile_view, name='user_profile'),
+    path('profile/<str:username>/heatmap/', views.activity_heatmap, name='activity_heatmap'),
     path('user/<int:user_id>/follow/', views.follow_user, name='follow_user'),
     path('user/<int:user_id>/friend/', views.add_friend, name='add_friend'),
 
     # Gym
     path('gym/', views.gym_view, name='gym'),
     path('gym/<int:gym_id>/join/', views.join_gym, name='join_gym'),
+    path('gym/nearest/', views.nearest_gyms, name='nearest_gyms'),
+    path('gym/map/', views.gym_map_data, name='gym_map_data'),
+    path('gym/<int:gym_id>/crowd/', views.gym_crowd, name='gym_crowd'),
     path('gym/leave/', views.leave_gym, name='leave_gym'),
     path('gym/invite/', views.post_gym_invite, name='post_gym_invite'),
     path('gym/invite/<int:invite_id>/respond/', views.respond_gym_invite, name='respond_gym_invite'),
@@ -45,6 +50,8 @@ urlpatterns = [
     # Chat
     path('chat/<str:chat_type>/<int:chat_id>/', views.chat_view, name='chat'),
     path('chat/<str:chat_type>/<int:chat_id>/send/', views.send_message, name='send_message'),
+    path('chat/<str:chat_type>/<int:chat_id>/stream/', views.chat_stream, name='chat_stream'),
+    path('chat/<str:chat_type>/<int:chat_id>/history/', views.chat_history, name='chat_history'),
 
     # Streaks
     path('streaks/', views.streaks_view, name='streaks'),
@@ -57,6 +64,8 @@ urlpatterns = [
     path('workout/<int:workout_id>/add-exercise/', views.add_exercise_to_workout, name='add_exercise'),
     path('workout/exercise/<int:exercise_id>/add-set/', views.add_set, name='add_set'),
     path('workout/set/<int:set_id>/update/', views.update_set, name='update_set'),
+    path('workout/<int:workout_id>/sets/batch/', views.batch_update_sets, name='batch_update_sets'),
+    path('workout/sync/', views.sync_workouts, name='sync_workouts'),
     path('workout/<int:workout_id>/complete/', views.complete_workout, name='complete_workout'),
     path('workout/<int:workout_id>/done/', views.workout_complete_view, name='workout_complete'),
     path('workout/<int:workout_id>/post/', views.post_workout_to_feed, name='post_workout'),
@@ -1,14 +1,27 @@
+import asyncio
+import hashlib
 import json
-from datetime import timedelta
+import time
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.contrib import messages as flash
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.db.models import Q, Count, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Count, Prefetch
 
 from .models import (
     Profile, Follow, Friendship, Gym, GymMembership, GymTopLifter,
@@ -22,6 +35,11 @@ from .forms import (
     QuickCheckinForm, PostForm, CommentForm, GroupForm, JoinGroupForm,
     MessageForm, WorkoutInviteForm, BusyLevelForm,
 )
+from .pagination import keyset_page, InvalidCursor
+from . import (
+    achievements, activity, badges, crowd, geo, groups, gyms, invites, leaderboard, realtime, social, stats, streaks, sync,
+    timeline, unread, workouts,
+)
 
 
 # ─── Auth ────────────────────────────────────────────────────────────────────
@@ -92,33 +110,13 @@ def logout_view(request):
 
 # ─── Feed ────────────────────────────────────────────────────────────────────
 
+FEED_PAGE_SIZE = 20
+
+
 @login_required
 def feed_view(request):
     tab = request.GET.get('tab', 'main')
-
-    if tab == 'friends':
-        friend_ids = set()
-        friendships = Friendship.objects.filter(
-            Q(from_user=request.user) | Q(to_user=request.user),
-            accepted=True
-        )
-        for f in friendships:
-            friend_ids.add(f.from_user_id if f.to_user == request.user else f.to_user_id)
-        following_ids = Follow.objects.filter(follower=request.user).values_list('following_id', flat=True)
-        friend_ids.update(following_ids)
-        posts = Post.objects.filter(user_id__in=friend_ids).select_related('user', 'user__profile', 'workout', 'gym')
-    else:
-        posts = Post.objects.all().select_related('user', 'user__profile', 'workout', 'gym')
-
-    posts = posts[:50]
-
-    # Get user reactions for displayed posts
-    user_reactions = {}
-    if posts:
-        post_ids = [p.id for p in posts]
-        reactions = Reaction.objects.filter(user=request.user, post_id__in=post_ids)
-        for r in reactions:
-            user_reactions[r.post_id] = r.reaction_type
+    posts, next_cursor = _feed_page(request.user, tab)
 
     checkin_form = QuickCheckinForm()
     post_form = PostForm()
@@ -126,14 +124,30 @@ def feed_view(request):
 
     return render(request, 'feed/feed.html', {
         'posts': posts,
+        'next_cursor': next_cursor,
         'tab': tab,
-        'user_reactions': user_reactions,
+        'user_reactions': _user_reactions(request.user, posts),
         'checkin_form': checkin_form,
         'post_form': post_form,
         'comment_form': comment_form,
     })
 
 
+@login_required
+def feed_page(request):
+    tab = request.GET.get('tab', 'main')
+    try:
+        posts, next_cursor = _feed_page(request.user, tab, request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'status': 'invalid cursor'}, status=400)
+
+    html = render_to_string('feed/_post_list.html', {
+        'posts': posts,
+        'user_reactions': _user_reactions(request.user, posts),
+    }, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
 # ─── Post Actions ────────────────────────────────────────────────────────────
 
 @login_required
@@ -155,8 +169,9 @@ def create_checkin(request):
             activities=activities,
             location=str(form.cleaned_data.get('gym', '')),
         )
-        # Update streak
-        _update_streak(request.user)
+        timeline.fan_out(post)
+        activity.record(request.user.id, streaks.local_date(request.user.profile))
+        _announce(request, streaks.record(request.user.profile) + achievements.emit('checkin', request.user.id))
         return redirect('feed')
     return redirect('feed')
 
@@ -189,7 +204,9 @@ def create_post(request):
             pr_exercise=form.cleaned_data.get('pr_exercise', ''),
             pr_weight=form.cleaned_data.get('pr_weight'),
         )
-        _update_streak(request.user)
+        timeline.fan_out(post)
+        activity.record(request.user.id, streaks.local_date(request.user.profile))
+        _announce(request, streaks.record(request.user.profile) + achievements.emit(post_type, request.user.id))
         return redirect('feed')
     return redirect('feed')
 
@@ -198,19 +215,44 @@ def create_post(request):
 @require_POST
 def react_to_post(request, post_id):
     reaction_type = request.POST.get('reaction_type', 'heart')
+    if reaction_type not in dict(Reaction.REACTION_CHOICES):
+        return JsonResponse({'status': 'invalid'}, status=400)
     post = get_object_or_404(Post, id=post_id)
-    existing = Reaction.objects.filter(user=request.user, post=post).first()
-    if existing:
-        if existing.reaction_type == reaction_type:
-            existing.delete()
-            return JsonResponse({'status': 'removed'})
-        else:
-            existing.reaction_type = reaction_type
-            existing.save()
-            return JsonResponse({'status': 'changed', 'type': reaction_type})
-    else:
-        Reaction.objects.create(user=request.user, post=post, reaction_type=reaction_type)
-        return JsonResponse({'status': 'added', 'type': reaction_type})
+    field = Reaction.counter_field(reaction_type)
+    with transaction.atomic():
+        existing = Reaction.objects.select_for_update().filter(user=request.user, post=post).first()
+        raced = False
+        if existing is None:
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(user=request.user, post=post, reaction_type=reaction_type)
+            except IntegrityError:
+                # A concurrent first reaction won the insert; apply this one on top of it
+                existing = Reaction.objects.select_for_update().get(user=request.user, post=post)
+                raced = True
+            else:
+                Post.objects.filter(id=post.id).update(**{field: F(field) + 1})
+                status = 'added'
+        if existing:
+            old_field = Reaction.counter_field(existing.reaction_type)
+            if existing.reaction_type == reaction_type and raced:
+                status = 'added'  # the same reaction sent twice
+            elif existing.reaction_type == reaction_type:
+                existing.delete()
+                Post.objects.filter(id=post.id).update(**{old_field: F(old_field) - 1})
+                status = 'removed'
+            else:
+                existing.reaction_type = reaction_type
+                existing.save()
+                Post.objects.filter(id=post.id).update(**{
+                    old_field: F(old_field) - 1,
+                    field: F(field) + 1,
+                })
+                status = 'changed'
+    count = Post.objects.values_list(field, flat=True).get(id=post.id)
+    if status == 'removed':
+        return JsonResponse({'status': status, 'count': count})
+    return JsonResponse({'status': status, 'type': reaction_type, 'count': count})
 
 
 @login_required
@@ -219,11 +261,13 @@ def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST)
     if form.is_valid():
-        Comment.objects.create(
-            user=request.user,
-            post=post,
-            content=form.cleaned_data['content']
-        )
+        with transaction.atomic():
+            Comment.objects.create(
+                user=request.user,
+                post=post,
+                content=form.cleaned_data['content']
+            )
+            Post.objects.filter(id=post.id).update(comment_count=F('comment_count') + 1)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'status': 'ok'})
     return redirect('feed')
@@ -259,33 +303,22 @@ def profile_view(request, username=None):
 
     # Calendar data
     import calendar
-    from datetime import date
     now = timezone.now()
     month = int(request.GET.get('month', now.month))
     year = int(request.GET.get('year', now.year))
     cal = calendar.monthcalendar(year, month)
-    workout_dates = set(
-        Workout.objects.filter(
-            user=profile_user, completed=True,
-            started_at__year=year, started_at__month=month
-        ).values_list('started_at__day', flat=True)
-    )
-    post_dates = set(
-        Post.objects.filter(
-            user=profile_user,
-            created_at__year=year, created_at__month=month
-        ).values_list('created_at__day', flat=True)
-    )
+    month_activity = activity.month(profile_user.id, year, month, streaks.zone(profile.timezone))
+    workout_dates = {day.day for day, counts in month_activity.items() if counts.workouts}
+    post_dates = {day.day for day, counts in month_activity.items() if counts.posts}
+    heatmap_days = []
+    if tab == 'calendar':
+        heatmap_days = activity.active_days(activity.year_bitmap(profile_user.id, year), year)
 
     is_following = False
     is_friend = False
     if request.user != profile_user:
-        is_following = Follow.objects.filter(follower=request.user, following=profile_user).exists()
-        is_friend = Friendship.objects.filter(
-            Q(from_user=request.user, to_user=profile_user) |
-            Q(from_user=profile_user, to_user=request.user),
-            accepted=True
-        ).exists()
+        is_following = social.is_following(request.user.id, profile_user.id)
+        is_friend = social.are_friends(request.user.id, profile_user.id)
 
     return render(request, 'profile/profile.html', {
         'profile_user': profile_user,
@@ -300,12 +333,31 @@ def profile_view(request, username=None):
         'calendar_month_name': calendar.month_name[month],
         'workout_dates': workout_dates,
         'post_dates': post_dates,
+        'heatmap_days': heatmap_days,
+        'heatmap_offset': range(date(year, 1, 1).weekday()),
         'is_following': is_following,
         'is_friend': is_friend,
         'is_own_profile': request.user == profile_user,
     })
 
 
+@login_required
+def activity_heatmap(request, username):
+    """A year of daily activity as a string of 0/1, January 1st first."""
+    profile_user = get_object_or_404(User, username=username)
+    try:
+        year = int(request.GET.get('year', timezone.localdate().year))
+        date(year, 1, 1)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid year'}, status=400)
+    days = activity.active_days(activity.year_bitmap(profile_user.id, year), year)
+    return JsonResponse({
+        'year': year,
+        'first_weekday': date(year, 1, 1).weekday(),
+        'days': ''.join('1' if active else '0' for active in days),
+    })
+
+
 @login_required
 @require_POST
 def edit_profile(request):
@@ -313,6 +365,9 @@ def edit_profile(request):
     form = ProfileEditForm(request.POST, request.FILES, instance=profile)
     if form.is_valid():
         form.save()
+        if 'timezone' in form.changed_data:
+            streaks.recompute([request.user.id])
+            activity.rebuild(request.user.id, streaks.zone(profile.timezone))
     return redirect('my_profile')
 
 
@@ -323,9 +378,13 @@ def follow_user(request, user_id):
     existing = Follow.objects.filter(follower=request.user, following=target)
     if existing.exists():
         existing.delete()
+        social.invalidate(request.user.id, target.id)
+        timeline.remove_source(request.user.id, target.id)
         return JsonResponse({'status': 'unfollowed'})
     else:
         Follow.objects.create(follower=request.user, following=target)
+        social.invalidate(request.user.id, target.id)
+        timeline.add_source(request.user.id, target.id)
         return JsonResponse({'status': 'followed'})
 
 
@@ -336,58 +395,135 @@ def add_friend(request, user_id):
     existing = Friendship.objects.filter(
         Q(from_user=request.user, to_user=target) |
         Q(from_user=target, to_user=request.user)
-    )
-    if not existing.exists():
+    ).first()
+    if existing is None:
         Friendship.objects.create(from_user=request.user, to_user=target)
+        social.invalidate(request.user.id, target.id)
+    elif not existing.accepted and existing.from_user_id == target.id:
+        # They already asked us; adding them back accepts the request
+        social.accept_friendship(existing)
+        _announce(request, achievements.emit('friend', request.user.id, target.id))
+        timeline.add_source(request.user.id, target.id)
+        timeline.add_source(target.id, request.user.id)
+        return JsonResponse({'status': 'accepted'})
     return JsonResponse({'status': 'sent'})
 
 
 # ─── Gym / Map ───────────────────────────────────────────────────────────────
 
+GYM_MAP_LIMIT = 500  # gyms per viewport
+
+
 @login_required
 def gym_view(request):
     user_gym = GymMembership.objects.filter(user=request.user, is_active=True).first()
-    gyms = Gym.objects.all()
+    nearby = []
 
     gym_detail = None
     top_lifters = []
-    invites = []
+    gym_invites = []
 
     if user_gym:
-        gym_detail = user_gym.gym
+        gym_detail = crowd.apply_live([user_gym.gym])[0]
         top_lifters = GymTopLifter.objects.filter(gym=gym_detail).select_related('user', 'user__profile')[:10]
-        invites = WorkoutInvite.objects.filter(
-            gym=gym_detail, status='pending'
-        ).select_related('from_user', 'from_user__profile')[:10]
+        gym_invites = invites.gym_board(request.user, gym_detail).select_related('from_user', 'from_user__profile')[:10]
+    else:
+        coords = _coords(request)
+        nearby = crowd.apply_live(geo.nearest(*coords) if coords else Gym.objects.order_by('name')[:geo.DEFAULT_K])
 
     invite_form = WorkoutInviteForm()
 
     return render(request, 'gym/map.html', {
-        'gyms': gyms,
+        'gyms': nearby,
         'user_gym': user_gym,
         'gym_detail': gym_detail,
         'top_lifters': top_lifters,
-        'invites': invites,
+        'invites': gym_invites,
         'invite_form': invite_form,
     })
 
 
+@login_required
+def nearest_gyms(request):
+    coords = _coords(request)
+    if coords is None:
+        return JsonResponse({'error': 'lat and lng are required'}, status=400)
+    try:
+        k = min(max(int(request.GET.get('k', geo.DEFAULT_K)), 1), 50)
+    except ValueError:
+        k = geo.DEFAULT_K
+    return JsonResponse({'gyms': [{
+        'id': gym.id,
+        'name': gym.name,
+        'address': gym.address,
+        'latitude': gym.latitude,
+        'longitude': gym.longitude,
+        'distance_miles': round(gym.distance_miles, 2),
+        'busy_level': gym.busy_level,
+    } for gym in crowd.apply_live(geo.nearest(*coords, k=k))]})
+
+
+@login_required
+def gym_map_data(request):
+    """Gyms in the viewport ``?south=&west=&north=&east=``, answering conditional GETs with 304."""
+    try:
+        cells = geo.box_cells(*(float(request.GET[side]) for side in ('south', 'west', 'north', 'east')))
+    except (KeyError, ValueError):
+        cells = None
+    if cells is None:
+        return JsonResponse({'error': f'south, west, north and east are required, '
+                                      f'at most {geo.MAX_BOX_DEGREES} degrees apart'}, status=400)
+
+    key = 'gym-map:' + ':'.join(map(str, cells))
+    entry = cache.get(key)
+    if entry is None:
+        nearby = geo.in_cells(*cells).order_by('id')[:GYM_MAP_LIMIT]
+        body = json.dumps({'gyms': [{
+            'id': gym.id,
+            'name': gym.name,
+            'address': gym.address,
+            'latitude': gym.latitude,
+            'longitude': gym.longitude,
+            'busy_level': gym.busy_level,
+            'member_count': gym.member_count,
+        } for gym in crowd.apply_live(nearby)]})
+        entry = {
+            'body': body,
+            'etag': '"%s"' % hashlib.md5(body.encode()).hexdigest(),
+            'last_modified': int(time.time()),
+        }
+        cache.set(key, entry, getattr(settings, 'SPOTTR_CROWD_CACHE_TIMEOUT', 60))
+
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+def gym_crowd(request, gym_id):
+    gym = get_object_or_404(Gym, id=gym_id)
+    return JsonResponse({
+        'live': crowd.live([gym.id])[gym.id],
+        'typical_by_hour': crowd.typical_by_hour(gym.id),
+    })
+
+
 @login_required
 @require_POST
 def join_gym(request, gym_id):
     gym = get_object_or_404(Gym, id=gym_id)
-    GymMembership.objects.filter(user=request.user, is_active=True).update(is_active=False)
-    GymMembership.objects.update_or_create(
-        user=request.user, gym=gym,
-        defaults={'is_active': True}
-    )
+    gyms.join(request.user, gym)
     return redirect('gym')
 
 
 @login_required
 @require_POST
 def leave_gym(request):
-    GymMembership.objects.filter(user=request.user, is_active=True).update(is_active=False)
+    gyms.leave(request.user)
     return redirect('gym')
 
 
@@ -398,31 +534,21 @@ def post_gym_invite(request):
     if form.is_valid():
         user_gym = GymMembership.objects.filter(user=request.user, is_active=True).first()
         if user_gym:
-            # Create invite for all gym members
-            members = GymMembership.objects.filter(
-                gym=user_gym.gym, is_active=True
-            ).exclude(user=request.user).select_related('user')
-            for member in members[:20]:
-                WorkoutInvite.objects.create(
-                    from_user=request.user,
-                    to_user=member.user,
-                    invite_type='gym',
-                    gym=user_gym.gym,
-                    workout_type=form.cleaned_data['workout_type'],
-                    message=form.cleaned_data.get('message', ''),
-                    spots=form.cleaned_data['spots'],
-                )
+            invites.invite_gym(
+                request.user, user_gym.gym,
+                workout_type=form.cleaned_data['workout_type'],
+                message=form.cleaned_data.get('message', ''),
+                spots=form.cleaned_data['spots'],
+            )
     return redirect('gym')
 
 
 @login_required
 @require_POST
 def respond_gym_invite(request, invite_id):
-    invite = get_object_or_404(WorkoutInvite, id=invite_id, to_user=request.user)
-    action = request.POST.get('action', 'decline')
-    invite.status = 'accepted' if action == 'accept' else 'declined'
-    invite.save()
-    return JsonResponse({'status': invite.status})
+    invite = get_object_or_404(invites.answerable(request.user), id=invite_id)
+    status = invites.respond(invite, request.user, request.POST.get('action', 'decline') == 'accept')
+    return JsonResponse({'status': status})
 
 
 @login_required
@@ -430,14 +556,9 @@ def respond_gym_invite(request, invite_id):
 def submit_busy_level(request):
     form = BusyLevelForm(request.POST)
     if form.is_valid():
-        level_map = {
-            '1': 'low', '2': 'low', '3': 'moderate', '4': 'high', '5': 'very_high'
-        }
-        user_gym = GymMembership.objects.filter(user=request.user, is_active=True).first()
+        user_gym = GymMembership.objects.filter(user=request.user, is_active=True).select_related('gym').first()
         if user_gym:
-            gym = user_gym.gym
-            gym.busy_level = level_map.get(form.cleaned_data['level'], 'low')
-            gym.save()
+            crowd.report(user_gym.gym, request.user, int(form.cleaned_data['level']))
     next_url = request.POST.get('next', 'feed')
     return redirect(next_url)
 
@@ -447,76 +568,44 @@ def submit_busy_level(request):
 @login_required
 def leaderboard_view(request):
     tab = request.GET.get('tab', 'gym')
+    metric = request.GET.get('metric', leaderboard.DEFAULT_METRIC)
+    period = request.GET.get('period', 'daily')
+    page = request.GET.get('page')
 
-    gym_leaderboard = []
-    friends_leaderboard = []
-
+    board = None
+    scope_id = cohort = None
     if tab == 'gym':
         user_gym = GymMembership.objects.filter(user=request.user, is_active=True).first()
         if user_gym:
-            members = GymMembership.objects.filter(
-                gym=user_gym.gym, is_active=True
-            ).select_related('user', 'user__profile')
-
-            entries = []
-            for m in members:
-                profile = m.user.profile
-                week_start = timezone.now() - timedelta(days=7)
-                weekly_workouts = Workout.objects.filter(
-                    user=m.user, completed=True, started_at__gte=week_start
-                ).count()
-                entries.append({
-                    'user': m.user,
-                    'profile': profile,
-                    'weekly_workouts': weekly_workouts,
-                    'streak': profile.current_streak,
-                    'level': _get_level(profile.total_workouts),
-                    'is_current_user': m.user == request.user,
-                })
-            entries.sort(key=lambda x: x['streak'], reverse=True)
-            for i, e in enumerate(entries):
-                e['rank'] = i + 1
-            gym_leaderboard = entries
+            scope_id = user_gym.gym_id
+            cohort = GymMembership.objects.filter(gym_id=user_gym.gym_id, is_active=True).values('user_id')
     else:
-        friend_ids = set()
-        friendships = Friendship.objects.filter(
-            Q(from_user=request.user) | Q(to_user=request.user),
-            accepted=True
-        )
-        for f in friendships:
-            friend_ids.add(f.from_user_id if f.to_user == request.user else f.to_user_id)
-        friend_ids.add(request.user.id)
-
-        friends = User.objects.filter(id__in=friend_ids).select_related('profile')
-        entries = []
-        for friend in friends:
-            profile = friend.profile
-            week_start = timezone.now() - timedelta(days=7)
-            weekly_workouts = Workout.objects.filter(
-                user=friend, completed=True, started_at__gte=week_start
-            ).count()
-            entries.append({
-                'user': friend,
-                'profile': profile,
-                'weekly_workouts': weekly_workouts,
-                'streak': profile.current_streak,
-                'level': _get_level(profile.total_workouts),
-                'is_current_user': friend == request.user,
-            })
-        entries.sort(key=lambda x: x['streak'], reverse=True)
-        for i, e in enumerate(entries):
-            e['rank'] = i + 1
-        friends_leaderboard = entries
+        scope_id = request.user.id
+        cohort = social.friend_ids(request.user.id) | {request.user.id}
 
+    if cohort is not None:
+        if period in ('daily', 'weekly'):
+            board = leaderboard.build_from_snapshot(
+                'gym' if tab == 'gym' else 'friends', scope_id, request.user, metric, period, page
+            )
+        if board is None:
+            board = leaderboard.build(cohort, request.user, metric, page)
+
+    entries = board['entries'] if board else []
     return render(request, 'leaderboard/leaderboard.html', {
         'tab': tab,
-        'gym_leaderboard': gym_leaderboard,
-        'friends_leaderboard': friends_leaderboard,
+        'board': board,
+        'metrics': leaderboard.METRICS,
+        'gym_leaderboard': entries if tab == 'gym' else [],
+        'friends_leaderboard': entries if tab != 'gym' else [],
     })
 
 
 # ─── Groups ──────────────────────────────────────────────────────────────────
 
+CHAT_PAGE_SIZE = 50
+
+
 @login_required
 def groups_view(request):
     # Pending friend invites
@@ -524,25 +613,17 @@ def groups_view(request):
         to_user=request.user, status='pending', invite_type='friend'
     ).select_related('from_user', 'from_user__profile')
 
+    unread_counts = unread.counts(request.user.id)
+
     # Friends list
-    friend_ids = set()
-    friendships = Friendship.objects.filter(
-        Q(from_user=request.user) | Q(to_user=request.user),
-        accepted=True
-    )
-    for f in friendships:
-        friend_ids.add(f.from_user_id if f.to_user == request.user else f.to_user_id)
-    friends = User.objects.filter(id__in=friend_ids).select_related('profile')
+    friends = list(User.objects.filter(id__in=social.friend_ids(request.user.id)).select_related('profile'))
+    for friend in friends:
+        friend.unread_count = unread_counts.get(unread.conversation_key('dm', friend.id), 0)
 
     # Groups
-    user_groups = Group.objects.filter(
-        group_members__user=request.user
-    ).annotate(
-        unread_count=Count(
-            'messages',
-            filter=Q(messages__read=False) & ~Q(messages__sender=request.user)
-        )
-    )
+    user_groups = list(Group.objects.filter(group_members__user=request.user))
+    for group in user_groups:
+        group.unread_count = unread_counts.get(unread.conversation_key('group', group.id), 0)
 
     group_form = GroupForm()
     join_form = JoinGroupForm()
@@ -563,20 +644,12 @@ def groups_view(request):
 def create_group(request):
     form = GroupForm(request.POST)
     if form.is_valid():
-        group = Group.objects.create(
-            name=form.cleaned_data['name'],
-            description=form.cleaned_data.get('description', ''),
-            creator=request.user,
+        groups.create_group(
+            request.user,
+            form.cleaned_data['name'],
+            form.cleaned_data.get('description', ''),
+            [uid for uid in request.POST.getlist('members') if uid.isdigit()],
         )
-        GroupMembership.objects.create(user=request.user, group=group, is_admin=True)
-
-        member_ids = request.POST.getlist('members')
-        for uid in member_ids:
-            try:
-                user = User.objects.get(id=uid)
-                GroupMembership.objects.get_or_create(user=user, group=group)
-            except User.DoesNotExist:
-                pass
     return redirect('groups')
 
 
@@ -585,11 +658,7 @@ def create_group(request):
 def join_group(request):
     form = JoinGroupForm(request.POST)
     if form.is_valid():
-        try:
-            group = Group.objects.get(join_code=form.cleaned_data['join_code'])
-            GroupMembership.objects.get_or_create(user=request.user, group=group)
-        except Group.DoesNotExist:
-            pass
+        groups.join_by_codes(request.user, form.cleaned_data['join_code'])
     return redirect('groups')
 
 
@@ -597,27 +666,24 @@ def join_group(request):
 def chat_view(request, chat_type, chat_id):
     if chat_type == 'group':
         group = get_object_or_404(Group, id=chat_id)
-        messages = Message.objects.filter(group=group).select_related('sender', 'sender__profile')[:100]
-        Message.objects.filter(group=group, read=False).exclude(sender=request.user).update(read=True)
+        messages, older_cursor = _chat_page(request.user, chat_type, group.id)
         chat_name = group.name
         chat_avatar = group.avatar_emoji
         member_count = group.member_count
     else:
         other_user = get_object_or_404(User, id=chat_id)
-        messages = Message.objects.filter(
-            Q(sender=request.user, recipient=other_user) |
-            Q(sender=other_user, recipient=request.user),
-            group__isnull=True
-        ).select_related('sender', 'sender__profile')[:100]
-        Message.objects.filter(sender=other_user, recipient=request.user, read=False).update(read=True)
+        messages, older_cursor = _chat_page(request.user, chat_type, other_user.id)
         chat_name = other_user.profile.display_name or other_user.username
         chat_avatar = other_user.profile.avatar_emoji
         member_count = None
 
+    if messages:
+        unread.mark_read(request.user.id, unread.conversation_key(chat_type, chat_id), messages[-1].id)
     form = MessageForm()
 
     return render(request, 'chat/chat.html', {
         'messages': messages,
+        'older_cursor': older_cursor,
         'chat_type': chat_type,
         'chat_id': chat_id,
         'chat_name': chat_name,
@@ -627,6 +693,22 @@ def chat_view(request, chat_type, chat_id):
     })
 
 
+@login_required
+def chat_history(request, chat_type, chat_id):
+    """Older messages before ``cursor``, oldest first, for scrolling back."""
+    if not _can_follow_chat(request.user, chat_type, chat_id):
+        return HttpResponse(status=403)
+    try:
+        messages, older_cursor = _chat_page(request.user, chat_type, chat_id, request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'status': 'invalid cursor'}, status=400)
+    html = render_to_string('chat/_message_list.html', {
+        'messages': messages,
+        'chat_type': chat_type,
+    }, request=request)
+    return JsonResponse({'html': html, 'next_cursor': older_cursor})
+
+
 @login_required
 @require_POST
 def send_message(request, chat_type, chat_id):
@@ -641,15 +723,55 @@ def send_message(request, chat_type, chat_id):
             kwargs['group'] = get_object_or_404(Group, id=chat_id)
         else:
             kwargs['recipient'] = get_object_or_404(User, id=chat_id)
-        Message.objects.create(**kwargs)
+        msg = Message.objects.create(**kwargs)
+        unread.message_sent(msg)
+        transaction.on_commit(lambda: _publish_message(msg, chat_type, chat_id))
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'status': 'ok',
+                'id': msg.id,
+                'html': _render_message(msg, request.user.id, chat_type),
+            })
+    elif request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
     return redirect('chat', chat_type=chat_type, chat_id=chat_id)
 
 
+CHAT_STREAM_HEARTBEAT = 15  # seconds between keepalive comments
+CHAT_STREAM_MAX_AGE = 300  # seconds before the client is asked to reconnect
+CHAT_POLL_RETRY = 3000  # ms the browser waits before reconnecting
+
+
+async def chat_stream(request, chat_type, chat_id):
+    """Server-sent events carrying only new messages for one chat."""
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return HttpResponse(status=401)
+    if not await sync_to_async(_can_follow_chat)(user, chat_type, chat_id):
+        return HttpResponse(status=403)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or 0)
+    except ValueError:
+        last_id = 0
+    if isinstance(request, ASGIRequest):
+        events = _chat_events(user, chat_type, chat_id, last_id)
+    else:
+        # Under WSGI a held-open stream would tie up a worker thread (and
+        # Django drains async iterators before sending), so answer with what
+        # was missed and let EventSource reconnect after ``retry``.
+        events = await sync_to_async(_chat_catch_up)(user, chat_type, chat_id, last_id)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_POST
 def nudge_user(request, user_id):
     target = get_object_or_404(User, id=user_id)
     Nudge.objects.create(from_user=request.user, to_user=target)
+    badges.invalidate(target.id)
     return JsonResponse({'status': 'nudged'})
 
 
@@ -658,30 +780,20 @@ def nudge_user(request, user_id):
 def send_friend_invite(request):
     form = WorkoutInviteForm(request.POST)
     if form.is_valid():
-        friend_ids = request.POST.getlist('friends')
-        for uid in friend_ids:
-            try:
-                user = User.objects.get(id=uid)
-                WorkoutInvite.objects.create(
-                    from_user=request.user,
-                    to_user=user,
-                    invite_type='friend',
-                    workout_type=form.cleaned_data['workout_type'],
-                    message=form.cleaned_data.get('message', ''),
-                    spots=form.cleaned_data['spots'],
-                )
-            except User.DoesNotExist:
-                pass
+        invites.invite_users(
+            request.user, request.POST.getlist('friends'),
+            workout_type=form.cleaned_data['workout_type'],
+            message=form.cleaned_data.get('message', ''),
+            spots=form.cleaned_data['spots'],
+        )
     return redirect('groups')
 
 
 @login_required
 @require_POST
 def respond_invite(request, invite_id):
-    invite = get_object_or_404(WorkoutInvite, id=invite_id, to_user=request.user)
-    action = request.POST.get('action', 'decline')
-    invite.status = 'accepted' if action == 'accept' else 'declined'
-    invite.save()
+    invite = get_object_or_404(invites.answerable(request.user), id=invite_id)
+    invites.respond(invite, request.user, request.POST.get('action', 'decline') == 'accept')
     return redirect('groups')
 
 
@@ -690,33 +802,26 @@ def respond_invite(request, invite_id):
 @login_required
 def streaks_view(request):
     profile = request.user.profile
-    today = timezone.now().date()
+    today = streaks.local_date(profile)
 
     # Weekly progress
     week_start = today - timedelta(days=today.weekday())
-    weekly_workouts = Workout.objects.filter(
-        user=request.user, completed=True,
-        started_at__date__gte=week_start
-    ).count()
-    weekly_post_count = Post.objects.filter(
-        user=request.user,
-        created_at__date__gte=week_start
-    ).count()
+    week_activity = activity.week(request.user.id, week_start, streaks.zone(profile.timezone))
+    weekly_workouts = sum(day.workouts for day in week_activity.values())
+    weekly_post_count = sum(day.posts for day in week_activity.values())
 
-    # Get days with activity this week
     week_days = []
     for i in range(7):
         day = week_start + timedelta(days=i)
-        has_activity = Post.objects.filter(user=request.user, created_at__date=day).exists()
         week_days.append({
             'date': day,
             'day_name': day.strftime('%a'),
-            'has_activity': has_activity,
+            'has_activity': day in week_activity,
             'is_today': day == today,
         })
 
     # Achievements
-    achievements = UserAchievement.objects.filter(
+    user_achievements = UserAchievement.objects.filter(
         user=request.user
     ).select_related('achievement')
 
@@ -734,7 +839,7 @@ def streaks_view(request):
         'weekly_workouts': weekly_workouts,
         'weekly_post_count': weekly_post_count,
         'week_days': week_days,
-        'achievements': achievements,
+        'user_achievements': user_achievements,
         'group_streaks': group_streaks,
         'streak_active': streak_active,
     })
@@ -785,29 +890,10 @@ def workout_builder_view(request, template_id=None, workout_id=None):
         workout = get_object_or_404(Workout, id=workout_id, user=request.user)
     elif template_id:
         template = get_object_or_404(WorkoutTemplate, id=template_id, user=request.user)
-        # Create workout from template
-        workout = Workout.objects.create(
-            user=request.user,
-            name=template.name,
-            template=template,
-        )
-        for te in template.template_exercises.all():
-            we = WorkoutExercise.objects.create(
-                workout=workout,
-                exercise=te.exercise,
-                order=te.order,
-            )
-            for i in range(te.default_sets):
-                WorkoutSet.objects.create(
-                    workout_exercise=we,
-                    set_number=i + 1,
-                    reps=te.default_reps,
-                    weight=te.default_weight,
-                )
-        template.last_used = timezone.now()
-        template.save()
+        workout = workouts.start_from_template(request.user, template)
     else:
         workout = Workout.objects.create(user=request.user, name='Empty Workout')
+        sync.touch(request.user.id, [workout])
 
     workout_exercises = workout.workout_exercises.select_related('exercise').prefetch_related('sets').all()
 
@@ -816,6 +902,7 @@ def workout_builder_view(request, template_id=None, workout_id=None):
         'workout_exercises': workout_exercises,
         'exercises': exercises,
         'categories': categories,
+        'sync_version': sync.current_version(request.user.id),
     })
 
 
@@ -825,11 +912,7 @@ def add_exercise_to_workout(request, workout_id):
     workout = get_object_or_404(Workout, id=workout_id, user=request.user)
     exercise_id = request.POST.get('exercise_id')
     exercise = get_object_or_404(ExerciseDefinition, id=exercise_id)
-    order = workout.workout_exercises.count()
-    we = WorkoutExercise.objects.create(workout=workout, exercise=exercise, order=order)
-    # Create 3 default sets
-    for i in range(3):
-        WorkoutSet.objects.create(workout_exercise=we, set_number=i + 1)
+    workouts.add_exercise(workout, exercise)
     return redirect('workout_builder_resume', workout_id=workout.id)
 
 
@@ -838,31 +921,84 @@ def add_exercise_to_workout(request, workout_id):
 def add_set(request, exercise_id):
     we = get_object_or_404(WorkoutExercise, id=exercise_id, workout__user=request.user)
     next_num = we.sets.count() + 1
-    WorkoutSet.objects.create(workout_exercise=we, set_number=next_num)
+    ws = WorkoutSet.objects.create(workout_exercise=we, set_number=next_num)
+    sync.touch(request.user.id, [ws])
     return redirect('workout_builder_resume', workout_id=we.workout.id)
 
 
 @login_required
 @require_POST
 def update_set(request, set_id):
-    ws = get_object_or_404(WorkoutSet, id=set_id, workout_exercise__workout__user=request.user)
+    ws = get_object_or_404(
+        WorkoutSet.objects.select_related('workout_exercise__workout'),
+        id=set_id, workout_exercise__workout__user=request.user
+    )
+    old_completed, old_weight = ws.completed, ws.weight
     ws.reps = request.POST.get('reps') or None
     ws.weight = request.POST.get('weight') or None
     ws.completed = request.POST.get('completed') == 'true'
     ws.save()
+    stats.set_changed(
+        ws.workout_exercise.workout, old_completed, old_weight,
+        ws.completed, float(ws.weight) if ws.weight is not None else None,
+    )
+    sync.touch(request.user.id, [ws])
     return JsonResponse({'status': 'ok'})
 
 
 @login_required
 @require_POST
-def complete_workout(request, workout_id):
+def batch_update_sets(request, workout_id):
     workout = get_object_or_404(Workout, id=workout_id, user=request.user)
-    workout.completed = True
-    workout.completed_at = timezone.now()
-    diff = workout.completed_at - workout.started_at
-    workout.duration_minutes = int(diff.total_seconds() / 60)
-    workout.save()
-    _update_streak(request.user)
+    try:
+        changes = json.loads(request.body or b'[]')
+        result = workouts.apply_set_changes(workout, changes)
+    except ValueError as e:  # malformed JSON or a SetChangeError
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=400)
+    return JsonResponse({'status': 'ok', **result})
+
+
+@login_required
+def sync_workouts(request):
+    """Push queued offline changes (POST) and pull everything newer than ``since``."""
+    conflicts = []
+    try:
+        if request.method == 'POST':
+            body = json.loads(request.body or b'{}')
+            since = int(body.get('since') or 0)
+            conflicts = sync.push(request.user, body.get('changes', []))
+        else:
+            since = int(request.GET.get('since') or 0)
+    except (ValueError, TypeError, OverflowError, AttributeError) as e:  # malformed JSON or a SyncError
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=400)
+    changes, version, has_more = sync.pull(request.user, since)
+    return JsonResponse({
+        'status': 'ok',
+        'version': version,
+        'has_more': has_more,
+        'changes': changes,
+        'conflicts': conflicts,
+    })
+
+
+@login_required
+@require_POST
+def complete_workout(request, workout_id):
+    with transaction.atomic():
+        # Locked so a double submit can't count the workout twice
+        workout = get_object_or_404(Workout.objects.select_for_update(), id=workout_id, user=request.user)
+        if workout.completed:
+            return redirect('workout_complete', workout_id=workout.id)
+        workout.completed = True
+        workout.completed_at = timezone.now()
+        diff = workout.completed_at - workout.started_at
+        workout.duration_minutes = int(diff.total_seconds() / 60)
+        workout.save()
+        stats.workout_completed(workout)
+        activity.record(request.user.id, streaks.local_date(request.user.profile, workout.started_at))
+        sync.touch(request.user.id, [workout])
+        unlocked = streaks.record(request.user.profile, workout.started_at)
+    _announce(request, unlocked + achievements.emit('workout', request.user.id))
     return redirect('workout_complete', workout_id=workout.id)
 
 
@@ -893,28 +1029,18 @@ def post_workout_to_feed(request, workout_id):
             image=image,
             location=request.POST.get('location', ''),
         )
+        timeline.fan_out(post)
+        activity.record(request.user.id, streaks.local_date(request.user.profile))
+        _announce(request, achievements.emit('post', request.user.id))
         workout.posted_to_feed = True
         workout.notes = description
         if image:
             workout.image = image
         workout.save()
+        sync.touch(request.user.id, [workout])
 
         if save_template and not workout.template:
-            template = WorkoutTemplate.objects.create(
-                user=request.user,
-                name=workout.name,
-                estimated_duration=workout.duration_minutes,
-                last_used=timezone.now(),
-            )
-            for we in workout.workout_exercises.all():
-                TemplateExercise.objects.create(
-                    template=template,
-                    exercise=we.exercise,
-                    order=we.order,
-                    default_sets=we.sets.count(),
-                    default_reps=we.sets.first().reps or 10 if we.sets.exists() else 10,
-                    default_weight=we.sets.first().weight if we.sets.exists() else None,
-                )
+            workouts.save_as_template(workout)
     return redirect('feed')
 
 
@@ -948,36 +1074,128 @@ def delete_template(request, template_id):
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 
-def _update_streak(user):
-    profile = user.profile
-    today = timezone.now().date()
-    yesterday = today - timedelta(days=1)
-
-    if profile.last_workout_date == today:
-        return  # Already counted today
-
-    if profile.last_workout_date == yesterday:
-        profile.current_streak += 1
-    elif profile.last_workout_date != today:
-        profile.current_streak = 1
-
-    profile.last_workout_date = today
-    if profile.current_streak > profile.longest_streak:
-        profile.longest_streak = profile.current_streak
-    profile.save()
-
-
-def _get_level(total_workouts):
-    if total_workouts >= 500:
-        return 50
-    elif total_workouts >= 200:
-        return 40
-    elif total_workouts >= 100:
-        return 30
-    elif total_workouts >= 50:
-        return 20
-    elif total_workouts >= 20:
-        return 10
-    elif total_workouts >= 5:
-        return 5
-    return 1
+def _feed_page(user, tab, cursor=None):
+    posts = Post.objects.select_related('user', 'user__profile', 'workout', 'gym').prefetch_related(
+        Prefetch('comments', queryset=Comment.objects.select_related('user', 'user__profile'))
+    ).annotate(
+        # Workout card stats, so the card does not count per post
+        workout_exercise_count=Count('workout__workout_exercises', distinct=True),
+        workout_set_count=Count(
+            'workout__workout_exercises__sets',
+            filter=Q(workout__workout_exercises__sets__completed=True), distinct=True,
+        ),
+    )
+    if tab == 'friends':
+        post_ids, next_cursor = timeline.read_timeline(user, cursor, size=FEED_PAGE_SIZE)
+        by_id = posts.in_bulk(post_ids)
+        return [by_id[pid] for pid in post_ids if pid in by_id], next_cursor
+    return keyset_page(posts, cursor=cursor, size=FEED_PAGE_SIZE)
+
+
+def _user_reactions(user, posts):
+    user_reactions = {}
+    if posts:
+        post_ids = [p.id for p in posts]
+        reactions = Reaction.objects.filter(user=user, post_id__in=post_ids)
+        for r in reactions:
+            user_reactions[r.post_id] = r.reaction_type
+    return user_reactions
+
+
+def _chat_messages(user, chat_type, chat_id):
+    if chat_type == 'group':
+        return Message.objects.filter(group_id=chat_id)
+    return Message.objects.filter(
+        Q(sender=user, recipient_id=chat_id) |
+        Q(sender_id=chat_id, recipient=user),
+        group__isnull=True
+    )
+
+
+def _chat_page(user, chat_type, chat_id, cursor=None):
+    """The newest page before ``cursor`` in display (oldest-first) order, plus the cursor for older ones."""
+    messages, older_cursor = keyset_page(
+        _chat_messages(user, chat_type, chat_id).select_related('sender', 'sender__profile'),
+        cursor=cursor, size=CHAT_PAGE_SIZE,
+    )
+    return messages[::-1], older_cursor
+
+
+def _render_message(msg, viewer_id, chat_type):
+    return render_to_string('chat/_message.html', {'msg': msg, 'viewer_id': viewer_id, 'chat_type': chat_type})
+
+
+def _publish_message(msg, chat_type, chat_id):
+    # Render both sides once here so subscribers never touch the database
+    realtime.publish(realtime.chat_channel(chat_type, chat_id, msg.sender_id), {
+        'id': msg.id,
+        'sender_id': msg.sender_id,
+        'own': _render_message(msg, msg.sender_id, chat_type),
+        'other': _render_message(msg, None, chat_type),
+    })
+
+
+def _missed_messages(user, chat_type, chat_id, last_id):
+    missed = _chat_messages(user, chat_type, chat_id).filter(id__gt=last_id).select_related(
+        'sender', 'sender__profile'
+    ).order_by('id')[:100]
+    return [(msg.id, _render_message(msg, user.id, chat_type)) for msg in missed]
+
+
+def _announce(request, unlocked):
+    """Flash the achievements the request's user just unlocked."""
+    for row in unlocked:
+        if row.user_id == request.user.id:
+            flash.success(request, f'{row.achievement.icon} Achievement unlocked: {row.achievement.name}')
+
+
+def _can_follow_chat(user, chat_type, chat_id):
+    if chat_type == 'group':
+        return GroupMembership.objects.filter(group_id=chat_id, user=user).exists()
+    return User.objects.filter(id=chat_id).exists()
+
+
+def _chat_catch_up(user, chat_type, chat_id, last_id):
+    return [f'retry: {CHAT_POLL_RETRY}\n\n'] + [
+        _sse_event(message_id, html) for message_id, html in _missed_messages(user, chat_type, chat_id, last_id)
+    ]
+
+
+def _sse_event(event_id, html):
+    return f'id: {event_id}\ndata: {json.dumps({"id": event_id, "html": html})}\n\n'
+
+
+async def _chat_events(user, chat_type, chat_id, last_id):
+    loop = asyncio.get_running_loop()
+    with realtime.subscribe(realtime.chat_channel(chat_type, chat_id, user.id)) as subscription:
+        yield f'retry: {CHAT_POLL_RETRY}\n\n'
+        if last_id:  # reconnecting: replay only what was missed
+            for message_id, html in await sync_to_async(_missed_messages)(user, chat_type, chat_id, last_id):
+                last_id = message_id
+                yield _sse_event(message_id, html)
+        deadline = loop.time() + CHAT_STREAM_MAX_AGE
+        while loop.time() < deadline:
+            payload = await subscription.get(timeout=CHAT_STREAM_HEARTBEAT)
+            if payload is None:
+                yield ': keepalive\n\n'
+            elif payload['id'] > last_id:
+                last_id = payload['id']
+                if payload['sender_id'] == user.id:
+                    yield _sse_event(last_id, payload['own'])
+                else:
+                    yield _sse_event(last_id, payload['other'])
+                    # The chat is open, so the message is read as it arrives
+                    await sync_to_async(unread.mark_read)(
+                        user.id, unread.conversation_key(chat_type, chat_id), last_id
+                    )
+
+
+def _coords(request):
+    """(lat, lng) from the query string, or None if missing or out of range."""
+    try:
+        lat, lng = float(request.GET['lat']), float(request.GET['lng'])
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
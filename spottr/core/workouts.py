@@ -0,0 +1,181 @@
+"""Build workouts and templates with bulk inserts.
+
+Each helper runs in one transaction and issues a fixed number of queries
+no matter how many exercises or sets are involved.
+"""
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from . import stats, sync
+from .models import TemplateExercise, Workout, WorkoutExercise, WorkoutSet, WorkoutTemplate
+
+DEFAULT_SETS = 3
+
+
+@transaction.atomic
+def start_from_template(user, template):
+    template_exercises = list(template.template_exercises.all())
+    workout = Workout.objects.create(user=user, name=template.name, template=template)
+    workout_exercises = WorkoutExercise.objects.bulk_create([
+        WorkoutExercise(workout=workout, exercise_id=te.exercise_id, order=te.order)
+        for te in template_exercises
+    ])
+    sets = WorkoutSet.objects.bulk_create([
+        WorkoutSet(workout_exercise=we, set_number=i + 1, reps=te.default_reps, weight=te.default_weight)
+        for we, te in zip(workout_exercises, template_exercises)
+        for i in range(te.default_sets)
+    ])
+    WorkoutTemplate.objects.filter(id=template.id).update(last_used=timezone.now())
+    sync.touch(user.id, [workout, *workout_exercises, *sets])
+    return workout
+
+
+@transaction.atomic
+def add_exercise(workout, exercise, sets=DEFAULT_SETS):
+    order = workout.workout_exercises.count()
+    we = WorkoutExercise.objects.create(workout=workout, exercise=exercise, order=order)
+    created = WorkoutSet.objects.bulk_create([
+        WorkoutSet(workout_exercise=we, set_number=i + 1) for i in range(sets)
+    ])
+    sync.touch(workout.user_id, [we, *created])
+    return we
+
+
+@transaction.atomic
+def save_as_template(workout):
+    workout_exercises = workout.workout_exercises.prefetch_related(
+        Prefetch('sets', queryset=WorkoutSet.objects.order_by('set_number'))
+    )
+    template = WorkoutTemplate.objects.create(
+        user=workout.user,
+        name=workout.name,
+        estimated_duration=workout.duration_minutes,
+        last_used=timezone.now(),
+    )
+    template_exercises = []
+    for we in workout_exercises:
+        sets = list(we.sets.all())
+        first = sets[0] if sets else None
+        template_exercises.append(TemplateExercise(
+            template=template,
+            exercise_id=we.exercise_id,
+            order=we.order,
+            default_sets=len(sets),
+            default_reps=(first.reps or 10) if first else 10,
+            default_weight=first.weight if first else None,
+        ))
+    TemplateExercise.objects.bulk_create(template_exercises)
+    return template
+
+
+# ─── Batch set edits ─────────────────────────────────────────────────────────
+
+SET_FIELDS = {
+    'reps': int,
+    'weight': float,
+    'distance': float,
+    'time_seconds': int,
+}
+
+
+class SetChangeError(ValueError):
+    pass
+
+
+def clean_set_fields(change):
+    """Cast the editable WorkoutSet fields present in ``change``."""
+    fields = {}
+    for name, cast in SET_FIELDS.items():
+        if name in change:
+            value = change[name]
+            if value in (None, ''):
+                fields[name] = None
+                continue
+            try:
+                fields[name] = cast(value)
+            except (TypeError, ValueError, OverflowError):
+                raise SetChangeError(f'Invalid {name}: {value!r}')
+    if 'completed' in change:
+        fields['completed'] = change['completed'] in (True, 1, 'true', '1')
+    return fields
+
+
+@transaction.atomic
+def apply_set_changes(workout, changes):
+    """Apply a list of set edits to ``workout``.
+
+    Each change is ``{"op": "update"|"create"|"delete", ...}``; updates and
+    deletes carry the set ``id``, creates carry ``exercise`` (a
+    WorkoutExercise ID of this workout) and an optional client ``ref`` that
+    is echoed back with the new set ID. All sets of the workout are loaded
+    in one query, which is also the ownership check.
+    """
+    if not isinstance(changes, list):
+        raise SetChangeError('Expected a list of changes')
+
+    sets = {
+        ws.id: ws for ws in WorkoutSet.objects.filter(workout_exercise__workout=workout)
+    }
+    exercise_ids = set(workout.workout_exercises.values_list('id', flat=True))
+    next_number = {}
+    for ws in sets.values():
+        next_number[ws.workout_exercise_id] = max(next_number.get(ws.workout_exercise_id, 1), ws.set_number + 1)
+
+    to_update = {}
+    to_create = []
+    refs = []
+    to_delete = set()
+    deltas = []
+    for change in changes:
+        if not isinstance(change, dict):
+            raise SetChangeError('Each change must be an object')
+        op = change.get('op', 'update')
+        if op == 'create':
+            exercise_id = change.get('exercise')
+            if exercise_id not in exercise_ids:
+                raise SetChangeError(f'Unknown exercise {exercise_id!r}')
+            fields = clean_set_fields(change)
+            number = next_number.get(exercise_id, 1)
+            next_number[exercise_id] = number + 1
+            to_create.append(WorkoutSet(workout_exercise_id=exercise_id, set_number=number, **fields))
+            refs.append(change.get('ref'))
+            deltas.append((False, None, fields.get('completed', False), fields.get('weight')))
+            continue
+
+        ws = sets.get(change.get('id'))
+        if ws is None:
+            raise SetChangeError(f'Unknown set {change.get("id")!r}')
+        if op == 'delete':
+            if ws.id not in to_delete:
+                to_delete.add(ws.id)
+                to_update.pop(ws.id, None)
+                deltas.append((ws.completed, ws.weight, False, None))
+        elif op == 'update':
+            if ws.id in to_delete:
+                continue
+            fields = clean_set_fields(change)
+            old = (ws.completed, ws.weight)
+            for name, value in fields.items():
+                setattr(ws, name, value)
+            to_update[ws.id] = ws
+            deltas.append((*old, ws.completed, ws.weight))
+        else:
+            raise SetChangeError(f'Unknown op {op!r}')
+
+    if to_update:
+        WorkoutSet.objects.bulk_update(to_update.values(), ['reps', 'weight', 'distance', 'time_seconds', 'completed'])
+    created = WorkoutSet.objects.bulk_create(to_create)
+    if to_delete:
+        WorkoutSet.objects.filter(id__in=to_delete).delete()
+    stats.sets_changed(workout, deltas)
+    sync.touch(
+        workout.user_id, [*to_update.values(), *created],
+        [('set', sets[set_id].client_id) for set_id in to_delete],
+    )
+
+    return {
+        'updated': len(to_update),
+        'created': [{'ref': ref, 'id': ws.id} for ref, ws in zip(refs, created)],
+        'deleted': len(to_delete),
+    }
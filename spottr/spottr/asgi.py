@@ -1,4 +1,10 @@
-"""ASGI config for Spottr project."""
+"""ASGI config for Spottr project.
+
+Serve through this entry point (``daphne spottr.asgi:application``) so the
+live chat streams hold an idle coroutine rather than a worker thread. Under
+WSGI (plain ``runserver``) chat_stream falls back to short catch-up responses
+that the browser polls.
+"""
 import os
 from django.core.asgi import get_asgi_application
 
@@ -54,6 +54,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'spottr.wsgi.application'
+ASGI_APPLICATION = 'spottr.asgi.application'
 
 DATABASES = {
     'default': {
@@ -83,3 +84,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
+
+# Friends timeline: authors with a larger audience than this are merged in
+# at read time instead of being fanned out to every follower on write.
+SPOTTR_TIMELINE_FANOUT_LIMIT = 5000
+
+# Per-user friend/follower/following ID sets are cached this many seconds.
+SPOTTR_SOCIAL_CACHE_TIMEOUT = 600
+
+# Pub/sub backend for live chat delivery. The in-process default only reaches
+# clients connected to the same worker; swap in a shared backend when scaling out.
+SPOTTR_REALTIME_BACKEND = 'core.realtime.LocalBroker'
+
+# Header and nav badge counts are cached per user this many seconds.
+SPOTTR_BADGES_CACHE_TIMEOUT = 300
+
+# Gym invites reaching more members than this are stored once as a broadcast
+# instead of one row per member.
+SPOTTR_INVITE_BROADCAST_THRESHOLD = 100
+
+# Live gym crowd levels are cached per gym this many seconds; a new report
+# clears its gym's entry.
+SPOTTR_CROWD_CACHE_TIMEOUT = 60
+
+# A group's day counts towards its streak when at least this share of its
+# members logged a workout or post.
+SPOTTR_GROUP_STREAK_QUORUM = 0.5
@@ -67,36 +67,164 @@ function toggleReaction(postId, reactionType, btn) {
     });
 }
 
-// --- Workout Set Updates ---
-function updateSet(setId, input) {
-    var csrf = document.querySelector('[name=csrfmiddlewaretoken]');
-    var token = csrf ? csrf.value : '';
-    fetch('/workout/set/' + setId + '/update/', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/x-www-form-urlencoded', 'X-CSRFToken': token },
-        body: 'weight=' + input.value
+// --- Workout Sync (offline-first builder) ---
+// Edits are queued in localStorage under each object's client ID, coalesced,
+// and pushed to the sync endpoint in one batch once there is a connection.
+// The queue is kept per user so a shared browser never pushes someone
+// else's edits.
+var SYNC_KEY_PREFIX = 'spottr:sync-queue:';
+var SYNC_DELAY = 800;
+var syncTimer = null;
+var syncing = false;
+
+function syncRoot() {
+    return document.querySelector('[data-sync-url]');
+}
+function syncKey() {
+    var root = syncRoot();
+    return root ? SYNC_KEY_PREFIX + root.dataset.syncUser : null;
+}
+function loadSyncQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(syncKey())) || { since: 0, changes: {} };
+    } catch (e) {
+        return { since: 0, changes: {} };
+    }
+}
+function saveSyncQueue(queue) {
+    var key = syncKey();
+    if (!key) return;
+    try { localStorage.setItem(key, JSON.stringify(queue)); } catch (e) {}
+}
+function newClientId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function(c) {
+        var r = Math.random() * 16 | 0;
+        return (c === 'x' ? r : (r & 0x3 | 0x8)).toString(16);
     });
 }
-function updateSetReps(setId, input) {
+function queueChange(kind, id, fields) {
+    var queue = loadSyncQueue();
+    var root = syncRoot();
+    if (root) queue.since = Math.max(queue.since, Number(root.dataset.syncVersion) || 0);
+    var change = queue.changes[id] || { kind: kind, id: id, op: 'upsert', base_version: queue.since, fields: {} };
+    for (var k in fields) change.fields[k] = fields[k];
+    queue.changes[id] = change;
+    saveSyncQueue(queue);
+    scheduleSync(SYNC_DELAY);
+}
+function scheduleSync(delay) {
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(flushSync, delay);
+}
+function flushSync(keepalive) {
+    clearTimeout(syncTimer);
+    var root = syncRoot();
+    var queue = loadSyncQueue();
+    var changes = Object.keys(queue.changes).map(function(k) { return queue.changes[k]; });
+    if (!root || !changes.length || syncing || !navigator.onLine) return Promise.resolve();
+    syncing = true;
     var csrf = document.querySelector('[name=csrfmiddlewaretoken]');
-    var token = csrf ? csrf.value : '';
-    fetch('/workout/set/' + setId + '/update/', {
+    return fetch(root.dataset.syncUrl, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/x-www-form-urlencoded', 'X-CSRFToken': token },
-        body: 'reps=' + input.value
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrf ? csrf.value : '' },
+        body: JSON.stringify({ since: queue.since, changes: changes }),
+        keepalive: keepalive === true
+    }).then(function(r) {
+        if (r.status >= 500) throw new Error('retry');
+        return r.json();
+    }).then(function(data) {
+        // Drop what was sent (a rejected batch would fail forever) but keep
+        // anything edited while the request was in flight
+        var latest = loadSyncQueue();
+        changes.forEach(function(c) {
+            if (JSON.stringify(latest.changes[c.id]) === JSON.stringify(c)) delete latest.changes[c.id];
+        });
+        if (data.status === 'ok') adoptServerChanges(root, latest, data);
+        saveSyncQueue(latest);
+        if (data.status === 'ok' && data.has_more) return pullSync(root);
+    }).then(function() {
+        syncing = false;
+    }).catch(function() {
+        syncing = false;
+        scheduleSync(SYNC_DELAY * 5);
     });
 }
-function toggleSetComplete(setId, btn) {
-    var csrf = document.querySelector('[name=csrfmiddlewaretoken]');
-    var token = csrf ? csrf.value : '';
+function pullSync(root) {
+    // A pull returns at most one page of changes; keep going until caught up
+    return fetch(root.dataset.syncUrl + '?since=' + loadSyncQueue().since).then(function(r) {
+        if (r.status >= 500) throw new Error('retry');
+        return r.json();
+    }).then(function(data) {
+        if (data.status !== 'ok') return;
+        var latest = loadSyncQueue();
+        adoptServerChanges(root, latest, data);
+        saveSyncQueue(latest);
+        if (data.has_more) return pullSync(root);
+    });
+}
+function adoptServerChanges(root, queue, data) {
+    queue.since = Math.max(queue.since, data.version);
+    root.dataset.syncVersion = queue.since;
+    data.changes.concat(data.conflicts).forEach(function(c) {
+        if (!queue.changes[c.id]) applyServerCopy(c);
+    });
+}
+function applyServerCopy(change) {
+    if (change.kind !== 'set') return;
+    var row = document.querySelector('.set-row[data-client-id="' + change.id + '"]');
+    if (!row) return;
+    if (change.deleted) {
+        row.remove();
+        return;
+    }
+    row.querySelector('[data-field=weight]').value = change.fields.weight === null ? '' : change.fields.weight;
+    row.querySelector('[data-field=reps]').value = change.fields.reps === null ? '' : change.fields.reps;
+    row.classList.toggle('set-completed', change.fields.completed);
+    row.querySelector('.set-check').classList.toggle('checked', change.fields.completed);
+}
+function finishWorkout(form) {
+    flushSync().then(function() { form.submit(); });
+    return false;
+}
+document.addEventListener('visibilitychange', function() {
+    if (document.visibilityState === 'hidden') flushSync(true);
+});
+window.addEventListener('online', function() { flushSync(); });
+
+function setRowId(el) {
+    return el.closest('.set-row').dataset.clientId;
+}
+function updateSet(input) {
+    queueChange('set', setRowId(input), { weight: input.value });
+}
+function updateSetReps(input) {
+    queueChange('set', setRowId(input), { reps: input.value });
+}
+function toggleSetComplete(btn) {
     btn.classList.toggle('checked');
     var row = btn.closest('.set-row');
-    if (row) row.classList.toggle('set-completed');
-    fetch('/workout/set/' + setId + '/update/', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/x-www-form-urlencoded', 'X-CSRFToken': token },
-        body: 'toggle_complete=1'
+    row.classList.toggle('set-completed');
+    queueChange('set', row.dataset.clientId, { completed: btn.classList.contains('checked') });
+}
+function addSetLocal(form) {
+    var rows = form.closest('.exercise-card').querySelectorAll('.set-row');
+    if (!rows.length || !syncRoot()) return true;  // nothing to copy; fall back to a normal post
+    var last = rows[rows.length - 1];
+    var row = last.cloneNode(true);
+    var number = (parseInt(last.querySelector('.set-col-num').textContent) || rows.length) + 1;
+    row.dataset.clientId = newClientId();
+    row.classList.remove('set-completed');
+    row.querySelector('.set-check').classList.remove('checked');
+    row.querySelector('.set-col-num').textContent = number;
+    last.after(row);
+    queueChange('set', row.dataset.clientId, {
+        exercise: form.dataset.exerciseId,
+        set_number: number,
+        weight: row.querySelector('[data-field=weight]').value,
+        reps: row.querySelector('[data-field=reps]').value
     });
+    return false;
 }
 
 // --- Exercise Filter (Workout Builder) ---
@@ -200,8 +328,162 @@ function nudgeUser(userId) {
     });
 }
 
+// --- Feed infinite scroll ---
+function loadMoreFeed(sentinel) {
+    if (sentinel.dataset.loading) return;
+    sentinel.dataset.loading = '1';
+    var url = sentinel.dataset.url + '&cursor=' + encodeURIComponent(sentinel.dataset.cursor);
+    fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+        .then(function(r) { return r.json(); })
+        .then(function(data) {
+            var list = document.getElementById('feedPosts');
+            if (list) list.insertAdjacentHTML('beforeend', data.html);
+            if (data.next_cursor) {
+                sentinel.dataset.cursor = data.next_cursor;
+                delete sentinel.dataset.loading;
+            } else {
+                sentinel.remove();
+            }
+        })
+        .catch(function() { delete sentinel.dataset.loading; });
+}
+function initFeedScroll() {
+    var sentinel = document.getElementById('feedSentinel');
+    if (!sentinel || !('IntersectionObserver' in window)) return;
+    var observer = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (entry.isIntersecting) loadMoreFeed(sentinel);
+        });
+    }, { rootMargin: '600px 0px' });
+    observer.observe(sentinel);
+}
+
+// --- Live chat ---
+function appendChatMessage(id, html) {
+    var list = document.getElementById('chatMessages');
+    if (!list || list.querySelector('[data-message-id="' + id + '"]')) return;
+    var empty = list.querySelector('.empty-state');
+    if (empty) empty.remove();
+    var atBottom = list.scrollHeight - list.scrollTop - list.clientHeight < 80;
+    list.insertAdjacentHTML('beforeend', html);
+    if (atBottom) list.scrollTop = list.scrollHeight;
+}
+function initChatStream() {
+    var list = document.getElementById('chatMessages');
+    if (!list || !list.dataset.streamUrl || !('EventSource' in window)) return;
+    var rendered = list.querySelectorAll('[data-message-id]');
+    var after = rendered.length ? rendered[rendered.length - 1].dataset.messageId : 0;
+    // EventSource resends Last-Event-ID on reconnect, so only the first
+    // connection needs to say where the rendered history ends
+    var source = new EventSource(list.dataset.streamUrl + '?after=' + after);
+    source.onmessage = function(e) {
+        var data = JSON.parse(e.data);
+        appendChatMessage(data.id, data.html);
+    };
+}
+function loadOlderMessages(btn) {
+    if (btn.dataset.loading) return;
+    btn.dataset.loading = '1';
+    var list = document.getElementById('chatMessages');
+    fetch(btn.dataset.url + '?cursor=' + encodeURIComponent(btn.dataset.cursor), {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' }
+    }).then(function(r) { return r.json(); }).then(function(data) {
+        // Keep the visible messages where they are while history grows above them
+        var fromBottom = list.scrollHeight - list.scrollTop;
+        btn.insertAdjacentHTML('afterend', data.html);
+        list.scrollTop = list.scrollHeight - fromBottom;
+        if (data.next_cursor) {
+            btn.dataset.cursor = data.next_cursor;
+            delete btn.dataset.loading;
+        } else {
+            btn.remove();
+        }
+    }).catch(function() { delete btn.dataset.loading; });
+}
+function sendChatMessage(form) {
+    var data = new FormData(form);
+    fetch(form.action, {
+        method: 'POST',
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+        body: data
+    }).then(function(r) { return r.json(); }).then(function(res) {
+        if (res.status !== 'ok') return;
+        appendChatMessage(res.id, res.html);
+        form.reset();
+    });
+    return false;
+}
+
+// --- Nearby gyms ---
+function initGymLocation() {
+    var list = document.getElementById('gymList');
+    if (!list || !('geolocation' in navigator)) return;
+    var params = new URLSearchParams(window.location.search);
+    if (params.has('lat')) return;
+    navigator.geolocation.getCurrentPosition(function(pos) {
+        params.set('lat', pos.coords.latitude.toFixed(5));
+        params.set('lng', pos.coords.longitude.toFixed(5));
+        window.location.search = params.toString();
+    });
+}
+
+// Keep the listed gyms' busy levels current from the map endpoint. The
+// response carries an ETag, so an unchanged area is a 304 for the browser.
+var GYM_REFRESH_MS = 60000;
+var GYM_BOX_DEGREES = 0.9;  // half-width; the endpoint allows boxes up to 2 degrees
+var BUSY_LEVELS = {
+    low: ['Not Crowded', '#22c55e'],
+    moderate: ['Moderately Crowded', '#f97316'],
+    high: ['Very Crowded', '#ef4444'],
+    very_high: ['At Capacity', '#a855f7']
+};
+function initGymMap() {
+    var list = document.getElementById('gymList');
+    var params = new URLSearchParams(window.location.search);
+    if (!list || !list.dataset.mapUrl || !params.has('lat')) return;
+    var lat = parseFloat(params.get('lat')), lng = parseFloat(params.get('lng'));
+    if (isNaN(lat) || isNaN(lng)) return;
+    var box = new URLSearchParams({
+        south: lat - GYM_BOX_DEGREES, west: lng - GYM_BOX_DEGREES,
+        north: lat + GYM_BOX_DEGREES, east: lng + GYM_BOX_DEGREES
+    });
+    function refresh() {
+        fetch(list.dataset.mapUrl + '?' + box.toString()).then(function(r) {
+            return r.ok ? r.json() : null;
+        }).then(function(data) {
+            if (!data) return;
+            data.gyms.forEach(function(gym) {
+                var card = list.querySelector('.gym-card[data-gym-id="' + gym.id + '"]');
+                var level = BUSY_LEVELS[gym.busy_level];
+                if (!card || !level) return;
+                var indicator = card.querySelector('.busy-indicator-sm');
+                indicator.style.setProperty('--busy-color', level[1]);
+                indicator.querySelector('span').textContent = level[0];
+            });
+        }).catch(function() {});
+    }
+    setInterval(refresh, GYM_REFRESH_MS);
+}
+
+// --- Time zone (streak days are counted in it) ---
+function detectTimezone() {
+    var zone;
+    try { zone = Intl.DateTimeFormat().resolvedOptions().timeZone; } catch (e) { return; }
+    if (!zone) return;
+    document.querySelectorAll('[data-detect-timezone]').forEach(function(input) {
+        input.value = zone;
+    });
+}
+
 // --- Init on page load ---
 document.addEventListener('DOMContentLoaded', function() {
+    if (syncRoot()) flushSync();
+    initFeedScroll();
+    initChatStream();
+    initGymLocation();
+    initGymMap();
+    detectTimezone();
+
     // Auto-scroll chat
     var chat = document.getElementById('chatMessages');
     if (chat) chat.scrollTop = chat.scrollHeight;